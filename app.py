@@ -1,48 +1,357 @@
 import pg8000
+import atexit
 import os
-from flask import Flask, render_template, request, flash, redirect, url_for
-from contextlib import contextmanager
-from dotenv import load_dotenv
+import threading
+import time
+from flask import Flask, render_template, request, flash, redirect, url_for, jsonify, stream_with_context
+from contextlib import contextmanager, ExitStack
+from urllib.parse import urlsplit, urlunsplit
+from config import DB_CREDENTIALS, DB_SCHEMA
+from db import ConnectionPool, StatementCache, RowStream
+from queries import (STATEMENTS, SORT_ACTIONS, SORT_FILTERS, RATING_CHANGES, RATING_DELTAS, PENDING_VOTES,
+                     like_pattern, owner_range)
+from pagination import PAGE_SIZE, fetch_page, parse_page_size
+from search_index import NameIndex, PrefixIndex, normalize
+from cache import ResultCache, SingleFlight, row_appids
+from catalogue import Catalogue
+from counts import CountService, planner_estimate
+from facets import FACETS, parse_selection
+from ratings import (RatingBatcher, Periodic, cast_sharded_vote, rollup_shards, cast_logged_vote, rollup_events,
+                     maintain_event_partitions, ingest_votes)
 
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY')
 
-load_dotenv()
+# Named prepared statements, parsed and planned on first use on each pooled
+# connection; statements of optional tables are only prepared where used
+statements = StatementCache(STATEMENTS)
 
-# Database credentials - in production, use environment variables
-DB_CREDENTIALS = {
-    'user': os.getenv('DB_USER'),
-    'password': os.getenv('DB_PASSWORD'),
-    'database': os.getenv('DB_NAME'),
-    'host': os.getenv('DB_HOST')
-}
+# One pool per worker process; connections are reused across requests
+pool = ConnectionPool(
+    DB_CREDENTIALS,
+    search_path=DB_SCHEMA,
+    minconn=int(os.getenv('DB_POOL_MIN', 0)),
+    maxconn=int(os.getenv('DB_POOL_MAX', 10)),
+    timeout=float(os.getenv('DB_POOL_TIMEOUT', 30)),
+)
+
+# Results of searches by term, dropped per game when its ratings change
+search_cache = ResultCache(
+    max_bytes=int(os.getenv('SEARCH_CACHE_BYTES', 16 * 1024 * 1024)),
+    ttl=float(os.getenv('SEARCH_CACHE_TTL', 300)),
+)
+
+# Detail pages by appid, dropped when the game's ratings change
+game_cache = ResultCache(
+    max_bytes=int(os.getenv('GAME_CACHE_BYTES', 4 * 1024 * 1024)),
+    ttl=float(os.getenv('GAME_CACHE_TTL', 300)),
+)
+
+_pool_warmed = False
+
+@app.before_request
+def _warm_up_pool():
+    """Open the pool's first DB_POOL_MIN connections when the worker serves its first request.
+
+    Not at import, where they would be opened before a pre-forking server
+    forks its workers, which would then share their sockets.
+    """
+    global _pool_warmed
+    if not _pool_warmed:
+        pool.warm_up()
+        _pool_warmed = True
 
 @contextmanager
 def get_db_connection():
-    """Context manager for database connections"""
-    conn = None
-    try:
-        conn = pg8000.connect(**DB_CREDENTIALS)
+    """Context manager for pooled database connections.
+
+    The connection already has the search_path set and is rolled back when it
+    goes back to the pool, so callers only need to commit their writes.
+    """
+    with pool.connection() as conn:
         yield conn
-    except pg8000.Error as e:
-        if conn:
-            conn.rollback()
-        raise e
+
+# Identical reads running at the same time share one database execution
+flights = SingleFlight()
+
+def shared_query(statement, **params):
+    """Rows of a read-only statement; concurrent identical calls share one execution.
+
+    Only the caller that runs the query takes a pooled connection, so
+    requests waiting on it don't hold one.
+    """
+    def run():
+        with get_db_connection() as db:
+            return statements.run(db, statement, **params)
+    return flights.do((statement, *sorted(params.items())), run)
+
+def shared_page(sort, after=None, before=None, page_size=PAGE_SIZE, pattern=None, filters=None):
+    """fetch_page() on a pooled connection, shared by concurrent identical requests"""
+    def run():
+        with get_db_connection() as db:
+            return fetch_page(statements, db, sort, after=after, before=before,
+                              page_size=page_size, pattern=pattern, filters=filters)
+    key = ('page', sort, after, before, page_size, pattern, *sorted((filters or {}).items()))
+    return flights.do(key, run)
+
+def _estimate_matching(term):
+    with get_db_connection() as db:
+        return planner_estimate(db, "SELECT 1 FROM steam WHERE name ILIKE :pattern", pattern=like_pattern(term))
+
+# Answers the 'Count' action; term counts share the search cache
+counts = CountService(
+    count_all=lambda: shared_query('count_all')[0][0],
+    count_matching=lambda term: shared_query('count_search', pattern=like_pattern(term))[0][0],
+    estimate_matching=_estimate_matching,
+    cache=search_cache,
+    total_ttl=search_cache.ttl,
+)
+
+# Rows fetched per round trip when a full-table listing is streamed
+STREAM_BATCH_SIZE = int(os.getenv('DB_STREAM_BATCH_SIZE', 500))
+
+def render_streamed(template, statement, params=None, **context):
+    """Render a template while the rows of ``statement`` stream in as ``games``.
+
+    Rows come from a server-side cursor in batches of STREAM_BATCH_SIZE and
+    are written to the client as they are rendered, so a full-table listing
+    never sits in memory. The pooled connection is held until the response
+    is closed.
+    """
+    stack = ExitStack()
+    try:
+        db = stack.enter_context(get_db_connection())
+        context['games'] = RowStream(db, STATEMENTS[statement], STREAM_BATCH_SIZE, **(params or {}))
+    except BaseException as e:
+        stack.__exit__(type(e), e, e.__traceback__)
+        raise
+
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template).stream(context)
+    stream.enable_buffering(100)
+    response = app.response_class(stream_with_context(stream))
+    response.call_on_close(stack.close)
+    return response
+
+_name_index = None
+_prefix_index = None
+_search_index_lock = threading.Lock()
+
+def _load_search_indexes():
+    """Build the worker's name indexes from one bulk read of the catalogue"""
+    global _name_index, _prefix_index
+    with _search_index_lock:
+        if _name_index is None:
+            with get_db_connection() as db:
+                rows = statements.run(db, 'name_index')
+            # Typeahead ranks by owner count, then by number of ratings
+            _prefix_index = PrefixIndex((appid, name, (owners_low, ratings))
+                                        for appid, name, owners_low, ratings in rows)
+            _name_index = NameIndex((appid, name) for appid, name, _, _ in rows)
+
+def get_name_index():
+    """The worker's trigram index over game names, built on first use"""
+    if _name_index is None:
+        _load_search_indexes()
+    return _name_index
+
+def get_prefix_index():
+    """The worker's ranked prefix index over game names, built on first use"""
+    if _prefix_index is None:
+        _load_search_indexes()
+    return _prefix_index
+
+# Seconds before the catalogue snapshot is rebuilt, picking up changes made
+# through other workers
+CATALOGUE_TTL = float(os.getenv('CATALOGUE_TTL', 300))
+
+_catalogue = None
+_catalogue_lock = threading.Lock()
+
+def get_catalogue():
+    """The worker's snapshot of the catalogue in every listing order.
+
+    Built on first use and rebuilt once older than CATALOGUE_TTL; while one
+    request rebuilds it, the others keep paging through the old snapshot.
+    """
+    global _catalogue
+    snapshot = _catalogue
+    if snapshot is not None and time.monotonic() - snapshot.built_at < CATALOGUE_TTL:
+        return snapshot
+    if not _catalogue_lock.acquire(blocking=snapshot is None):
+        return snapshot
+    try:
+        if _catalogue is snapshot:
+            with get_db_connection() as db:
+                rows = statements.run(db, 'catalogue')
+            _catalogue = Catalogue(rows)
+        return _catalogue
     finally:
-        if conn:
-            conn.close()
+        _catalogue_lock.release()
+
+def ratings_changed(changed):
+    """Bring in-memory state up to date with the rows a rating write returned.
+
+    Rows start with appid and end with review_score.
+    """
+    # Only cached results showing these games are stale
+    appids = [row[0] for row in changed]
+    search_cache.invalidate_appids(appids)
+    game_cache.invalidate_appids(appids)
+    if _catalogue is not None:
+        for row in changed:
+            _catalogue.set_review_score(row[0], row[-1])
+
+# Seconds between checks for catalogue refreshes published by
+# 'manage.py refresh-steam' and 'manage.py load-steam'; 0 turns the check off
+CATALOGUE_REFRESH_POLL = float(os.getenv('CATALOGUE_REFRESH_POLL', 10))
+
+_refresh_seen = None
+_refresh_poller = None
+_refresh_poller_lock = threading.Lock()
+
+def _apply_catalogue_refreshes():
+    """Drop what the catalogue refreshes published since the last check made stale.
+
+    Detail pages are dropped per changed game. A new or renamed game can
+    belong in any cached search, so inserts and updates clear the search
+    cache while deletes only drop their games; a full reload clears every
+    cache.
+    The in-memory snapshots and name indexes are rebuilt on next use.
+    """
+    global _refresh_seen, _catalogue, _name_index, _prefix_index
+    with get_db_connection() as db:
+        if _refresh_seen is None:
+            # Caches built from here on already see every earlier refresh
+            (_refresh_seen,), = statements.run(db, 'latest_catalogue_refresh')
+            return 0
+        refreshes = statements.run(db, 'catalogue_refreshes_since', after=_refresh_seen)
+    if not refreshes:
+        return 0
+    appids = set()
+    any_written = any_reloaded = False
+    for refresh_id, inserted, updated, deleted, reloaded in refreshes:
+        appids.update(inserted, updated, deleted)
+        any_written = any_written or bool(inserted or updated)
+        any_reloaded = any_reloaded or reloaded
+        counts.adjust_total(len(inserted) - len(deleted))
+        _refresh_seen = refresh_id
+    if any_reloaded:
+        game_cache.clear()
+        counts.reset_total()
+    else:
+        game_cache.invalidate_appids(appids)
+    if any_written or any_reloaded:
+        search_cache.clear()
+    else:
+        search_cache.invalidate_appids(appids)
+    _catalogue = None
+    _name_index = _prefix_index = None
+    return len(appids)
+
+@app.before_request
+def _start_refresh_poller():
+    """Start checking for catalogue refreshes once the worker serves its first request"""
+    global _refresh_poller
+    if _refresh_poller is not None or CATALOGUE_REFRESH_POLL <= 0:
+        return
+    with _refresh_poller_lock:
+        if _refresh_poller is None:
+            _refresh_poller = Periodic(_apply_catalogue_refreshes, interval=CATALOGUE_REFRESH_POLL,
+                                       name="catalogue-refresh", immediately=True)
+            atexit.register(_refresh_poller.close)
+
+def _apply_rating_batch(deltas):
+    appids = list(deltas)
+    with get_db_connection() as db:
+        changed = statements.run(db, 'rating_batch', appids=appids,
+                                 positive=[deltas[appid][0] for appid in appids],
+                                 negative=[deltas[appid][1] for appid in appids])
+        db.commit()
+    ratings_changed(changed)
+    return len(changed)
+
+def _rollup_rating_shards():
+    with get_db_connection() as db:
+        changed = rollup_shards(db, statements)
+    ratings_changed(changed)
+    return len(changed)
+
+def _rollup_rating_events():
+    with get_db_connection() as db:
+        changed = rollup_events(db, statements)
+    ratings_changed(changed)
+    return len(changed)
+
+def _maintain_rating_events():
+    with get_db_connection() as db:
+        return len(maintain_event_partitions(db, keep_days=RATING_EVENT_RETENTION_DAYS))
+
+# 'direct' commits every vote as it is cast; 'batched' hands votes to a
+# write-behind RatingBatcher that commits them a few milliseconds later;
+# 'sharded' commits every vote to one of RATING_SHARDS counter rows per game
+# and 'events' appends it to the rating event log; in both, a background
+# rollup folds the votes into steam every RATING_ROLLUP_INTERVAL seconds
+RATING_MODE = os.getenv('RATING_MODE', 'direct')
+RATING_SHARDS = int(os.getenv('RATING_SHARDS', 16))
+RATING_ROLLUP_INTERVAL = float(os.getenv('RATING_ROLLUP_INTERVAL', 5))
+# Days rolled up event partitions are kept before they are dropped
+RATING_EVENT_RETENTION_DAYS = int(os.getenv('RATING_EVENT_RETENTION_DAYS', 7))
+rating_batcher = None
+rating_rollup = None
+rating_partitions = None
+_rating_jobs_started = False
+_rating_jobs_lock = threading.Lock()
+
+@app.before_request
+def _start_rating_jobs():
+    """Start the rating mode's background writer once the worker serves its first request.
+
+    Not at import, where it would already replay the vote logs of dead
+    workers or roll up votes while manage.py migrates or rolls up itself.
+    """
+    global rating_batcher, rating_rollup, rating_partitions, _rating_jobs_started
+    if _rating_jobs_started:
+        return
+    with _rating_jobs_lock:
+        if _rating_jobs_started:
+            return
+        if RATING_MODE == 'batched':
+            rating_batcher = RatingBatcher(
+                _apply_rating_batch,
+                interval=float(os.getenv('RATING_BATCH_INTERVAL_MS', 5)) / 1000,
+                max_events=int(os.getenv('RATING_BATCH_SIZE', 500)),
+                log_dir=os.getenv('RATING_LOG_DIR') or None,
+                fsync=os.getenv('RATING_LOG_FSYNC') == '1',
+            )
+            atexit.register(rating_batcher.close)
+        elif RATING_MODE == 'sharded':
+            rating_rollup = Periodic(_rollup_rating_shards, interval=RATING_ROLLUP_INTERVAL, name="rating-rollup")
+            atexit.register(rating_rollup.close)
+        elif RATING_MODE == 'events':
+            rating_rollup = Periodic(_rollup_rating_events, interval=RATING_ROLLUP_INTERVAL, name="rating-rollup")
+            atexit.register(rating_rollup.close)
+            # Creates today's partition right away, before events pile up in the default one
+            rating_partitions = Periodic(_maintain_rating_events, interval=3600, name="rating-partitions",
+                                         immediately=True)
+            atexit.register(rating_partitions.close)
+        _rating_jobs_started = True
 
 @app.route("/")
 def home():
-    """Home page - display all games"""
+    """Home page - display games a page at a time"""
+    page_size = request.args.get('page_size')
     try:
-        with get_db_connection() as db:
-            cursor = db.cursor()
-            cursor.execute("SET search_path TO maxwell_lamb")
-            cursor.execute("SELECT name, release_date, price, ROUND(((positive_ratings::float/(positive_ratings+negative_ratings))*100)::numeric, 2) AS reviews FROM steam ORDER BY appid")
-            games = cursor.fetchall()
-        
-        return render_template("index.html", games=games)
+        if page_size == 'all':
+            return render_streamed("index.html", 'list_appid')
+
+        games = get_catalogue().page('appid', after=request.args.get('after'), before=request.args.get('before'),
+                                     page_size=parse_page_size(page_size))
+
+        return render_template("index.html", games=games, pager_args={'page_size': page_size})
+    except ValueError:
+        flash("That page link is no longer valid", "warning")
+        return redirect(url_for('home'))
     except pg8000.Error as e:
         flash(f"Database error: {str(e)}", "error")
         return render_template("index.html", games=[])
@@ -50,6 +359,34 @@ def home():
         flash(f"Unexpected error: {str(e)}", "error")
         return render_template("index.html", games=[])
 
+# Most results shown for a typo-tolerant or full-text search
+FUZZY_RESULTS = 20
+FULLTEXT_RESULTS = 50
+
+def search_rows(mode, game_name):
+    """Rows for one search mode ('name', 'fuzzy' or 'fulltext'), cached by term"""
+    def compute():
+        if mode == 'fulltext':
+            with get_db_connection() as db:
+                return list(statements.run(db, 'search_fulltext', query=game_name, limit=FULLTEXT_RESULTS))
+
+        index = get_name_index()
+        if mode == 'name':
+            appids = index.search(game_name)
+        else:
+            appids = [appid for appid, _ in index.fuzzy_search(game_name, limit=FUZZY_RESULTS)]
+        if not appids:
+            return []
+        with get_db_connection() as db:
+            rows = statements.run(db, 'search', appids=appids)
+        if mode == 'fuzzy':
+            # Rows come back in appid order; restore best-match-first
+            rank = {appid: i for i, appid in enumerate(appids)}
+            return sorted(rows, key=lambda row: rank[row[-1]])
+        return list(rows)
+
+    return search_cache.get_or_compute(('search', mode, normalize(game_name)), compute)
+
 @app.route("/search", methods=['GET', 'POST'])
 def search():
     """Search for a specific game"""
@@ -58,19 +395,35 @@ def search():
         
         if not game_name:
             flash("Please enter the name of a game", "warning")
-            return render_template("search.html", result=None, game_name=None)
+            return render_template("search.html", results=None, game_name=None)
         
+        # 'name' (substring), 'fuzzy' (typo-tolerant) or 'fulltext' (ranked, all text columns)
+        mode = request.form.get('mode', 'name')
         try:
-            with get_db_connection() as db:
-                cursor = db.cursor()
-                cursor.execute("SET search_path TO maxwell_lamb")
-                query = "SELECT name, release_date, price, ROUND(((positive_ratings::float/(positive_ratings+negative_ratings))*100)::numeric, 2) AS reviews FROM steam WHERE name ILIKE %s ORDER BY appid"
-                search_pattern = f"%{game_name}%"
-                cursor.execute(query, [search_pattern])
-                results = cursor.fetchall()
+            if mode not in ('name', 'fuzzy', 'fulltext'):
+                mode = 'name'
+            results = search_rows(mode, game_name)
+            fell_back = False
+            if not results and mode == 'name':
+                # Fall back to the closest names rather than a dead end on a typo
+                fell_back = True
+                mode = 'fuzzy'
+                results = search_rows(mode, game_name)
             
             if results:
-                return render_template("search.html", results=results, game_name=game_name)
+                if fell_back:
+                    flash(f"No exact match for {game_name}; showing the closest names", "info")
+                # Facets narrow the matches and are counted over them
+                snapshot = get_catalogue()
+                selection = parse_selection(request.form)
+                base = snapshot.bitmap_of(row_appids(results))
+                if selection:
+                    keep = snapshot.appids_of(snapshot.facets.select(selection, base))
+                    results = [row for row in results if row[-1] in keep]
+                return render_template("search.html", results=results, game_name=game_name, mode=mode,
+                                       facet_counts=snapshot.facets.counts(selection, base),
+                                       selection=selection, facet_labels=FACETS,
+                                       facet_args={'game_name': game_name, 'mode': mode})
             else:
                 flash(f"No game found with name: {game_name}", "info")
                 return render_template("search.html", results=None, game_name=game_name)
@@ -81,102 +434,160 @@ def search():
     
     return render_template("search.html", results=None, game_name=None)
 
-@app.route("/result", methods=['POST'])
+@app.route("/autocomplete")
+def autocomplete():
+    """JSON typeahead suggestions for a name prefix, answered from memory"""
+    prefix = request.args.get('q', '').strip()
+    limit = request.args.get('limit', 10, type=int)
+    try:
+        suggestions = get_prefix_index().complete(prefix, limit) if prefix else []
+    except pg8000.Error as e:
+        return jsonify(error=f"Database error: {str(e)}", suggestions=[]), 503
+    return jsonify(suggestions=[{'appid': appid, 'name': name} for appid, name in suggestions])
+
+# Steam columns the detail page doesn't show
+HIDDEN_DETAIL_COLUMNS = {'search_document'}
+
+def game_detail(appid):
+    """(column, value) pairs of one game's steam row and support links, cached by appid.
+
+    Empty if there is no such game. In the modes that defer votes, the
+    rating columns include the votes not yet rolled up.
+    """
+    def compute():
+        live = None
+        with get_db_connection() as db:
+            rows = statements.run(db, 'game_detail', appid=appid)
+            if not rows:
+                return []
+            columns = statements.columns(db, 'game_detail')
+            if RATING_MODE in PENDING_VOTES:
+                live = statements.run(db, f'rating_live_{RATING_MODE}', appids=[appid])
+        game = {column: value for column, value in zip(columns, rows[0]) if column not in HIDDEN_DETAIL_COLUMNS}
+        if live:
+            (_, _, game['positive_ratings'], game['negative_ratings'], game['review_score']), = live
+        return list(game.items())
+
+    return game_cache.get_or_compute(('game', appid), compute, appids_of=lambda fields: (appid,))
+
+@app.route("/game/<int:appid>")
+def game(appid):
+    """Everything known about one game, looked up by appid; JSON for clients that ask for it"""
+    wants_json = request.accept_mimetypes.best == 'application/json'
+    try:
+        fields = game_detail(appid)
+    except pg8000.Error as e:
+        if wants_json:
+            return jsonify(error=f"Database error: {str(e)}"), 503
+        flash(f"Database error: {str(e)}", "error")
+        return redirect(url_for('home'))
+
+    if not fields:
+        if wants_json:
+            return jsonify(error=f"No game with appid {appid}"), 404
+        flash(f"No game with appid {appid}", "warning")
+        return redirect(url_for('home'))
+    if wants_json:
+        return jsonify(dict(fields))
+    return render_template('game.html', game=dict(fields), fields=fields, last_page=back_link())
+
+def _local_path(url, referrer=False):
+    """``url`` if it is a path on this site, else None.
+
+    Only a path starting with a single '/' is taken, so a link built from
+    it can't lead to another site or run a javascript: URL. A ``referrer``
+    may be absolute, as browsers send it, if it names this host.
+    """
+    if not url:
+        return None
+    parts = urlsplit(url)
+    if parts.scheme or parts.netloc:
+        if not referrer or parts.scheme not in ('http', 'https') or parts.netloc != request.host:
+            return None
+        url = urlunsplit(('', '', parts.path, parts.query, parts.fragment))
+    # Browsers drop tabs and newlines and read backslashes as '/', any of which could make it '//host'
+    if not url.startswith('/') or url.startswith('//') or '\\' in url or any(c < ' ' for c in url):
+        return None
+    return url
+
+def back_link():
+    """Where a page's back link goes: its 'back' parameter, the referring page or home"""
+    return (_local_path(request.values.get('back')) or _local_path(request.referrer, referrer=True)
+            or url_for('home'))
+
+@app.route("/result", methods=['GET', 'POST'])
 def result():
     """Process form data and display results"""
     try:
-        last_page = request.referrer or url_for('home')
+        # Page links are GETs, so they carry the original page along as 'back'
+        last_page = back_link()
         # Get form data
-        action = request.form.get('action')
-        game_name = request.form.get("game_name")
+        action = request.values.get('action')
+        game_name = request.values.get("game_name")
+        page_size = request.values.get('page_size')
+        # Owner range ('low-high') for the listings that take one
+        owners = request.values.get('owners')
+        # Facet values picked on a listing
+        selection = parse_selection(request.values)
         
         if game_name:
-            search_pattern = f"%{game_name}%"
-            searched = """
-                    WITH searched AS (
-                            SELECT name, release_date, price, positive_ratings, negative_ratings, ROUND(((positive_ratings::float/(positive_ratings+negative_ratings))*100)::numeric, 2) AS reviews
-                            FROM steam 
-                            WHERE name ILIKE %s
-                    )"""
-        
-        with get_db_connection() as db:
-            cursor = db.cursor()
-            cursor.execute("SET search_path TO maxwell_lamb")
-
-            if action == 'Count':
-                if game_name:
-                    cursor.execute(searched + "SELECT COUNT(*) FROM searched", [search_pattern])
-                    count = cursor.fetchone()[0]
-                    return render_template('result.html', 
-                                     message=f"Total games found: {count}", last_page=last_page)
-                else:
-                    cursor.execute("SELECT COUNT(*) FROM steam")
-                    count = cursor.fetchone()[0]
-                    return render_template('result.html', 
-                                     message=f"Total games in database: {count}", last_page=last_page)
-            
-            elif action == 'By Newest':
-                if game_name:
-                    cursor.execute(searched + "SELECT name, release_date, price, reviews FROM searched ORDER BY release_date DESC", [search_pattern])
-                else:
-                    cursor.execute("SELECT name, release_date, price, ROUND(((positive_ratings::float/(positive_ratings+negative_ratings))*100)::numeric, 2) AS reviews FROM steam ORDER BY release_date DESC")
-                result = cursor.fetchall()
-                if result:
-                    return render_template('result.html', games=result, last_page=last_page)
-                else:
-                    return render_template('result.html', message="No games found", last_page=last_page)
-            
-            elif action == 'By Rating':
-                if game_name:
-                    search_pattern = f"%{game_name}%"
-                    cursor.execute(searched + "SELECT name, release_date, price, reviews FROM searched ORDER BY reviews DESC", [search_pattern])
-                else:
-                    cursor.execute("SELECT name, release_date, price, ROUND(((positive_ratings::float/(positive_ratings+negative_ratings))*100)::numeric, 2) AS reviews FROM steam ORDER BY reviews DESC")
-                result = cursor.fetchall()
-                if result:
-                    return render_template('result.html', games=result, last_page=last_page)
-                else:
-                    return render_template('result.html', message="No games found", last_page=last_page)
-            
-            elif action == 'By Price':
-                if game_name:
-                    search_pattern = f"%{game_name}%"
-                    cursor.execute(searched + "SELECT name, release_date, price, ROUND(((positive_ratings::float/(positive_ratings+negative_ratings))*100)::numeric, 2) AS reviews FROM searched ORDER BY price", [search_pattern])
-                else:
-                    cursor.execute("SELECT name, release_date, price, ROUND(((positive_ratings::float/(positive_ratings+negative_ratings))*100)::numeric, 2) AS reviews FROM steam ORDER BY price")
-                result = cursor.fetchall()
-                if result:
-                    return render_template('result.html', games=result, last_page=last_page)
-                else:
-                    return render_template('result.html', message="No games found", last_page=last_page)
-            
-            elif action == 'By Player Count':
-                if game_name:
-                    search_pattern = f"%{game_name}%"
-                    cursor.execute(searched + "SELECT name, release_date, price, ROUND(((positive_ratings::float/(positive_ratings+negative_ratings))*100)::numeric, 2) AS reviews FROM searched ORDER BY owners DESC", [search_pattern])
-                else:
-                    cursor.execute("SELECT name, release_date, price, ROUND(((positive_ratings::float/(positive_ratings+negative_ratings))*100)::numeric, 2) AS reviews FROM steam ORDER BY owners DESC")
-                result = cursor.fetchall()
-                if result:
-                    return render_template('result.html', games=result, last_page=last_page)
-                else:
-                    return render_template('result.html', message="No games found", last_page=last_page)
-                
-            elif action == 'By Name':
-                if game_name:
-                    search_pattern = f"%{game_name}%"
-                    cursor.execute(searched + "SELECT name, release_date, price, ROUND(((positive_ratings::float/(positive_ratings+negative_ratings))*100)::numeric, 2) AS reviews FROM searched ORDER BY name", [search_pattern])
-                else:
-                    cursor.execute("SELECT name, release_date, price, ROUND(((positive_ratings::float/(positive_ratings+negative_ratings))*100)::numeric, 2) AS reviews FROM steam ORDER BY name")
-                result = cursor.fetchall()
-                if result:
-                    return render_template('result.html', games=result, last_page=last_page)
-                else:
-                    return render_template('result.html', message="No games found", last_page=last_page)
-            
+            search_pattern = like_pattern(game_name)
+            term = normalize(game_name)
+
+        if action in SORT_ACTIONS:
+            sort = SORT_ACTIONS[action]
+            filters = owner_range(owners) if sort in SORT_FILTERS else {}
+
+        if action in SORT_ACTIONS and page_size == 'all' and not selection:
+            # Full listings are streamed instead of fetched in one go
+            if game_name:
+                return render_streamed('result.html', f'search_{sort}', {'pattern': search_pattern, **filters},
+                                       last_page=last_page)
+            return render_streamed('result.html', f'list_{sort}', filters, last_page=last_page)
+
+        if action == 'Count':
+            if game_name:
+                count = counts.matching(game_name, _name_index)
+                message = (f"Total games found: {count.value}" if count.exact
+                           else f"About {count.value} games found (estimated)")
+                return render_template('result.html', message=message, last_page=last_page)
+            else:
+                count = counts.total()
+                return render_template('result.html', 
+                                 message=f"Total games in database: {count.value}", last_page=last_page)
+
+        elif action in SORT_ACTIONS:
+            after, before = request.values.get('after'), request.values.get('before')
+            snapshot = get_catalogue()
+            size = len(snapshot) if page_size == 'all' else parse_page_size(page_size)
+            matches = get_name_index().search(game_name) if game_name else None
+            # Facets are evaluated in memory, within the name matches if there is a term
+            base = snapshot.bitmap_of(matches) if game_name else None
+            if selection:
+                result = snapshot.page(sort, after, before, size, filters=filters,
+                                       rows_in=snapshot.facets.select(selection, base))
+            elif game_name:
+                # A vote for any match can move it onto a rating sorted page,
+                # so those pages are dropped with every match's ratings
+                result = search_cache.get_or_compute(
+                    ('page', sort, term, after, before, size, *filters.values()),
+                    lambda: shared_page(sort, after, before, size, pattern=search_pattern, filters=filters),
+                    appids_of=(lambda page: matches) if sort == 'rating' else row_appids)
             else:
-                return render_template('result.html', message="Unknown action", last_page=last_page)
+                result = snapshot.page(sort, after, before, size, filters=filters)
+            facet_args = {'action': action, 'game_name': game_name, 'back': last_page,
+                          'page_size': page_size, 'owners': owners}
+            pager_args = dict(facet_args, **{facet: sorted(values) for facet, values in selection.items()})
+            return render_template('result.html', games=result, last_page=last_page, pager_args=pager_args,
+                                   facet_counts=snapshot.facets.counts(selection, base),
+                                   selection=selection, facet_labels=FACETS, facet_args=facet_args)
+        
+        else:
+            return render_template('result.html', message="Unknown action", last_page=last_page)
     
+    except ValueError:
+        flash("That page link is no longer valid", "warning")
+        return redirect(url_for('home'))
     except pg8000.Error as e:
         flash(f"Database error: {str(e)}", "error")
         return redirect(url_for('home'))
@@ -195,20 +606,16 @@ def modify():
         return render_template("modify.html", results=None, game_name=None)
     
     try:
-        with get_db_connection() as db:
-            cursor = db.cursor()
-            cursor.execute("SET search_path TO maxwell_lamb")
-            query = """
-                SELECT name, positive_ratings, negative_ratings,
-                       ROUND(((positive_ratings::float/(positive_ratings+negative_ratings))*100)::numeric, 2)
-                       AS reviews
-                FROM steam
-                WHERE name ILIKE %s
-                ORDER BY appid
-            """
-            search_pattern = f"%{game_name}%"
-            cursor.execute(query, [search_pattern])
-            results = cursor.fetchall()
+        def compute():
+            appids = get_name_index().search(game_name)
+            if not appids:
+                return []
+            # Deferred votes have to be added in for the counts to be current
+            statement = f'modify_{RATING_MODE}' if RATING_MODE in PENDING_VOTES else 'modify'
+            with get_db_connection() as db:
+                return list(statements.run(db, statement, appids=appids))
+
+        results = search_cache.get_or_compute(('modify', normalize(game_name)), compute)
 
         if results:
             return render_template("modify.html", results=results, game_name=game_name)
@@ -222,52 +629,93 @@ def modify():
 
 @app.route("/update_rating", methods=['POST'])
 def update_rating():
+    """Apply one rating click to one game.
+
+    Clients that accept JSON (the modify page's script) get the game's new
+    counts back and update the row in place; plain form posts are
+    redirected back to the modify page.
+    """
+    appid = request.form.get("appid", type=int)
     game_name = request.form.get("game_name")
     field = request.form.get("field")
+    search_term = request.form.get("search_term", game_name)
+    wants_json = request.accept_mimetypes.best == 'application/json'
+
+    if appid is None or field not in RATING_CHANGES:
+        if wants_json:
+            return jsonify(error="Unknown game or rating change"), 400
+        flash("Unknown game or rating change", "warning")
+        return redirect(url_for("modify", game_name=search_term))
 
     try:
-        with get_db_connection() as db:
-            cursor = db.cursor()
-            cursor.execute("SET search_path TO maxwell_lamb")
-
-            if field == "positive_add":
-                cursor.execute("""
-                    UPDATE steam
-                    SET positive_ratings = positive_ratings + 1
-                    WHERE name = %s
-                """, [game_name])
-
-            elif field == "positive_remove":
-                cursor.execute("""
-                    UPDATE steam
-                    SET positive_ratings = positive_ratings - 1
-                    WHERE name = %s
-                """, [game_name])
-
-            elif field == "negative_add":
-                cursor.execute("""
-                    UPDATE steam
-                    SET negative_ratings = negative_ratings + 1
-                    WHERE name = %s
-                """, [game_name])
-
-            elif field == "negative_remove":
-                cursor.execute("""
-                    UPDATE steam
-                    SET negative_ratings = negative_ratings - 1
-                    WHERE name = %s
-                """, [game_name])
-
-            db.commit()
+        if rating_batcher is not None:
+            rating_batcher.add(appid, *RATING_DELTAS[field])
+            if wants_json:
+                positive, negative = RATING_DELTAS[field]
+                return jsonify(appid=appid, queued=True, positive_delta=positive, negative_delta=negative), 202
+        else:
+            with get_db_connection() as db:
+                if RATING_MODE == 'sharded':
+                    changed = cast_sharded_vote(db, statements, appid, *RATING_DELTAS[field], shards=RATING_SHARDS)
+                elif RATING_MODE == 'events':
+                    changed = cast_logged_vote(db, statements, appid, *RATING_DELTAS[field])
+                else:
+                    changed = statements.run(db, f'rating_{field}', appid=appid)
+                    db.commit()
+            ratings_changed(changed)
+            if not changed:
+                if wants_json:
+                    return jsonify(error=f"No game with appid {appid}"), 404
+                flash(f"No game with appid {appid}", "warning")
+                return redirect(url_for("modify", game_name=search_term))
+            (appid, game_name, positive, negative, reviews), = changed
+            if wants_json:
+                return jsonify(appid=appid, name=game_name, positive_ratings=positive, negative_ratings=negative,
+                               reviews=float(reviews) if reviews is not None else None)
 
         flash(f"Updated {field.split("_")[0]} reviews for {game_name}.", "success")
-        search_term = request.form.get("search_term", game_name)
         return redirect(url_for("modify", game_name=search_term))
 
     except pg8000.Error as e:
+        if wants_json:
+            return jsonify(error=f"Database error: {str(e)}"), 503
         flash(f"Database error: {str(e)}", "error")
         return redirect(url_for("modify"))
 
+@app.route("/ratings/bulk", methods=['POST'])
+def ingest_ratings():
+    """Apply (appid, positive_delta, negative_delta) votes in bulk.
+
+    The body is NDJSON or, with a text/csv content type or ?format=csv, CSV.
+    It is read line by line and streamed to Postgres with COPY, so the
+    upload size is not bounded by memory.
+    """
+    fmt = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'ndjson')
+    lines = (line.decode('utf-8') for line in request.stream)
+    try:
+        with get_db_connection() as db:
+            report = ingest_votes(db, lines, fmt, statements)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    except pg8000.Error as e:
+        return jsonify(error=f"Database error: {str(e)}"), 503
+    ratings_changed(report.pop('changed'))
+    return jsonify(report)
+
+@app.route("/stats")
+def stats():
+    """Runtime counters for tuning"""
+    return jsonify(pool=pool.stats(), statements=statements.stats(), search_cache=search_cache.stats(),
+                   game_cache=game_cache.stats(),
+                   catalogue_refresh=_refresh_poller.stats() if _refresh_poller else None,
+                   flights=flights.stats(), catalogue=_catalogue.stats() if _catalogue else None,
+                   counts=counts.stats(),
+                   ratings=rating_batcher.stats() if rating_batcher else None,
+                   rating_rollup=rating_rollup.stats() if rating_rollup else None,
+                   rating_partitions=rating_partitions.stats() if rating_partitions else None,
+                   name_index=_name_index.stats() if _name_index else None,
+                   prefix_index=_prefix_index.stats() if _prefix_index else None)
+
 @app.errorhandler(404)
 def not_found(e):
     return render_template('404.html'), 404
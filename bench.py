@@ -0,0 +1,474 @@
+"""Micro-benchmarks against the configured database.
+
+Usage:  python bench.py <benchmark> [options]
+
+Every benchmark reads the same DB_* settings as app.py (config.py) and only reads data
+unless stated otherwise.
+"""
+import argparse
+import csv
+import io
+import itertools
+import pathlib
+import random
+import re
+import resource
+import statistics
+import tempfile
+import threading
+import time
+
+from config import DB_CREDENTIALS, DB_SCHEMA
+from db import connect, StatementCache
+from loaders import SUPPORT_FIELDS, load_support, load_steam
+from pagination import fetch_page
+from queries import STATEMENTS, SORTS, SORT_FILTERS, like_pattern, owner_range
+from ratings import RatingBatcher, cast_sharded_vote, rollup_shards, cast_logged_vote, rollup_events
+from search_index import NameIndex, PrefixIndex
+
+
+def timed(fn, repeat):
+    """Run ``fn`` ``repeat`` times and return per-call latencies in ms"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def summary(samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return f"median {statistics.median(samples):8.3f} ms   p95 {p95:8.3f} ms"
+
+
+def planning_time(conn, sql, params):
+    """Server-side planning time in ms as reported by EXPLAIN"""
+    rows = conn.run(f"EXPLAIN (SUMMARY ON) {sql}", **params)
+    conn.rollback()
+    for (line,) in rows:
+        if line.startswith("Planning Time:"):
+            return float(line.split()[2])
+    return float('nan')
+
+
+def bench_statements(args):
+    """Ad-hoc parse/plan/execute vs. a prepared statement, per route query"""
+    conn = connect(DB_CREDENTIALS, DB_SCHEMA)
+    params = {'pattern': f"%{args.term}%", 'limit': 51, **owner_range(None)}
+    print(f"{'statement':<22} {'plan':>9}   {'ad-hoc':<36} {'prepared':<36} saved")
+    for name, sql in STATEMENTS.items():
+        needed = set(re.findall(r"(?<!:):([a-z_]+)", sql))
+        if name.startswith('rating_') or needed - params.keys():
+            # Skip writes and keyset seeks, which need a position to start from
+            continue
+        used = {k: params[k] for k in needed}
+        plan_ms = planning_time(conn, sql, used)
+
+        adhoc = timed(lambda: conn.run(sql, **used), args.repeat)
+        ps = conn.prepare(sql)
+        prepared = timed(lambda: ps.run(**used), args.repeat)
+        ps.close()
+        conn.rollback()
+
+        saved = statistics.median(adhoc) - statistics.median(prepared)
+        print(f"{name:<22} {plan_ms:7.3f}ms   {summary(adhoc):<36} {summary(prepared):<36} {saved:+.3f} ms")
+    conn.close()
+
+
+def bench_pagination(args):
+    """Keyset page latency at increasing depth vs. OFFSET at the same depth"""
+    conn = connect(DB_CREDENTIALS, DB_SCHEMA)
+    cache = StatementCache(STATEMENTS)
+    size = args.page_size
+    print(f"{'sort':<14} {'page 1':>10} {f'page {args.pages}':>10} {f'OFFSET {size * (args.pages - 1)}':>14}")
+    for sort, (column, direction) in SORTS.items():
+        cursor, samples = None, []
+        for _ in range(args.pages):
+            start = time.perf_counter()
+            page = fetch_page(cache, conn, sort, after=cursor, page_size=size,
+                              filters=owner_range(None) if sort in SORT_FILTERS else None)
+            samples.append((time.perf_counter() - start) * 1000)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+
+        offset_sql = (f"SELECT name FROM steam ORDER BY {column} {direction}, appid {direction} "
+                      f"LIMIT {size} OFFSET {size * (len(samples) - 1)}")
+        offset = timed(lambda: conn.run(offset_sql), 5)
+        conn.rollback()
+        print(f"{sort:<14} {samples[0]:8.3f}ms {samples[-1]:8.3f}ms {statistics.median(offset):12.3f}ms")
+    conn.close()
+
+
+# 'By Rating' as it ran before migrations/002_review_score.sql: the score is
+# computed for every row and the sort cannot use an index
+LEGACY_REVIEWS = "ROUND(((positive_ratings::float/NULLIF(positive_ratings+negative_ratings, 0))*100)::numeric, 2)"
+LEGACY_RATING_SQL = (f"SELECT name, release_date, price, {LEGACY_REVIEWS} AS reviews FROM steam "
+                     f"ORDER BY reviews DESC NULLS LAST, appid DESC")
+
+
+def bench_rating(args):
+    """'By Rating' with the per-row computed score vs. the stored, indexed review_score"""
+    conn = connect(DB_CREDENTIALS, DB_SCHEMA)
+    cache = StatementCache(STATEMENTS)
+    cases = [
+        ("computed, full listing", lambda: conn.run(LEGACY_RATING_SQL)),
+        ("stored, full listing", lambda: cache.run(conn, 'list_rating')),
+        (f"computed, first {args.page_size}", lambda: conn.run(f"{LEGACY_RATING_SQL} LIMIT {args.page_size}")),
+        (f"stored, first {args.page_size}", lambda: fetch_page(cache, conn, 'rating', page_size=args.page_size)),
+    ]
+    for label, fn in cases:
+        print(f"{label:<28} {summary(timed(fn, args.repeat))}")
+        conn.rollback()
+
+    for label, sql, params in (("computed", f"{LEGACY_RATING_SQL} LIMIT {args.page_size}", {}),
+                               ("stored", STATEMENTS['page_rating_first'], {'limit': args.page_size})):
+        plan = conn.run(f"EXPLAIN {sql}", **params)
+        conn.rollback()
+        print(f"{label} plan: " + " / ".join(line.strip() for (line,) in plan[:3]))
+    conn.close()
+
+
+def bench_trigram(args):
+    """ILIKE '%term%' latency with and without a pg_trgm GIN index at several table sizes.
+
+    Builds an UNLOGGED scratch table per size from copies of the steam names
+    and drops it afterwards.
+    """
+    conn = connect(DB_CREDENTIALS, DB_SCHEMA)
+    (total,), = conn.run("SELECT COUNT(*) FROM steam")
+    terms = args.terms.split(',')
+    print(f"{'rows':>10} {'term':<12} {'seq scan':<36} {'trigram index':<36}")
+    for rows in (int(n) for n in args.sizes.split(',')):
+        conn.run("DROP TABLE IF EXISTS trgm_bench")
+        conn.run("""
+            CREATE UNLOGGED TABLE trgm_bench AS
+            SELECT s.appid, CASE WHEN g = 1 THEN s.name ELSE s.name || ' ' || g END AS name
+            FROM generate_series(1, :copies) AS g CROSS JOIN steam AS s
+            LIMIT :rows
+        """, copies=-(-rows // total), rows=rows)
+        conn.run("ANALYZE trgm_bench")
+        conn.commit()
+
+        sql = "SELECT appid FROM trgm_bench WHERE name ILIKE :pattern"
+        without = {t: timed(lambda: conn.run(sql, pattern=like_pattern(t)), args.repeat) for t in terms}
+        conn.rollback()
+        conn.run("CREATE INDEX ON trgm_bench USING gin (name gin_trgm_ops)")
+        conn.run("ANALYZE trgm_bench")
+        conn.commit()
+        for term in terms:
+            with_index = timed(lambda: conn.run(sql, pattern=like_pattern(term)), args.repeat)
+            print(f"{rows:>10} {term:<12} {summary(without[term]):<36} {summary(with_index):<36}")
+        conn.rollback()
+
+    conn.run("DROP TABLE IF EXISTS trgm_bench")
+    conn.commit()
+    conn.close()
+
+
+def bench_name_index(args):
+    """In-process trigram index lookups vs. ILIKE in Postgres, per search term"""
+    conn = connect(DB_CREDENTIALS, DB_SCHEMA)
+    index = NameIndex((appid, name) for appid, name, *_ in conn.run(STATEMENTS['name_index']))
+    conn.rollback()
+    print(f"built over {len(index)} names: {index.stats()}")
+    sql = "SELECT appid FROM steam WHERE name ILIKE :pattern"
+    for term in args.terms.split(','):
+        in_process = timed(lambda: index.search(term), args.repeat)
+        postgres = timed(lambda: conn.run(sql, pattern=like_pattern(term)), args.repeat)
+        conn.rollback()
+        print(f"{term:<12} {len(index.search(term)):>6} hits   index {summary(in_process)}   ILIKE {summary(postgres)}")
+    conn.close()
+
+
+def bench_autocomplete(args):
+    """Typeahead latency for random 1-6 character prefixes of real game names"""
+    conn = connect(DB_CREDENTIALS, DB_SCHEMA)
+    rows = conn.run(STATEMENTS['name_index'])
+    conn.close()
+    index = PrefixIndex((appid, name, (owners_low, ratings)) for appid, name, owners_low, ratings in rows)
+    names = [name for _, name, *_ in rows if name]
+    prefixes = [name[:random.randint(1, 6)] for name in random.choices(names, k=args.repeat * 100)]
+    samples = []
+    for prefix in prefixes:
+        start = time.perf_counter()
+        index.complete(prefix, 10)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    p99 = samples[int(len(samples) * 0.99)]
+    print(f"{len(samples)} lookups over {len(index)} names: {summary(samples)}   p99 {p99:.3f} ms")
+
+
+def bench_fulltext(args):
+    """Ranked full-text search vs. OR'd ILIKEs over the same five text columns"""
+    conn = connect(DB_CREDENTIALS, DB_SCHEMA)
+    columns = ("name", "developer", "publisher", "genres", "steamspy_tags")
+    ilike_sql = (f"SELECT appid FROM steam WHERE {' OR '.join(f'{c} ILIKE :pattern' for c in columns)} "
+                 f"ORDER BY appid LIMIT :limit")
+    fulltext_sql = STATEMENTS['search_fulltext']
+    for term in args.terms.split(','):
+        ilike = timed(lambda: conn.run(ilike_sql, pattern=like_pattern(term), limit=50), args.repeat)
+        fulltext = timed(lambda: conn.run(fulltext_sql, query=term, limit=50), args.repeat)
+        conn.rollback()
+        print(f"{term:<12} ILIKE x{len(columns)} {summary(ilike)}   full text {summary(fulltext)}")
+    conn.close()
+
+
+def bench_votes(args):
+    """Votes per second: an UPDATE and commit per vote vs. write-behind batches.
+
+    Writes: casts --votes positive votes across random games from --threads
+    client threads, in each mode, then takes them back off again.
+    """
+    conn = connect(DB_CREDENTIALS, DB_SCHEMA)
+    appids = [appid for (appid,) in conn.run("SELECT appid FROM steam ORDER BY random() LIMIT 100")]
+    conn.rollback()
+    conn.close()
+    per_thread = args.votes // args.threads
+    cast = {}
+    cast_lock = threading.Lock()
+
+    def run_clients(vote):
+        def client():
+            for _ in range(per_thread):
+                appid = random.choice(appids)
+                vote(appid)
+                with cast_lock:
+                    cast[appid] = cast.get(appid, 0) + 1
+        threads = [threading.Thread(target=client) for _ in range(args.threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return start
+
+    # Direct: one connection per client, one commit per vote
+    local = threading.local()
+    cache = StatementCache(STATEMENTS)
+    clients = []
+
+    def direct(appid):
+        if not hasattr(local, 'conn'):
+            local.conn = connect(DB_CREDENTIALS, DB_SCHEMA)
+            clients.append(local.conn)
+        cache.run(local.conn, 'rating_positive_add', appid=appid)
+        local.conn.commit()
+
+    start = run_clients(direct)
+    direct_rate = per_thread * args.threads / (time.perf_counter() - start)
+    for client_conn in clients:
+        client_conn.close()
+
+    # Batched: clients only queue; the clock stops once the last batch is committed
+    writer = connect(DB_CREDENTIALS, DB_SCHEMA)
+
+    def apply(deltas):
+        batch = list(deltas)
+        rows = cache.run(writer, 'rating_batch', appids=batch, positive=[deltas[a][0] for a in batch],
+                         negative=[deltas[a][1] for a in batch])
+        writer.commit()
+        return len(rows)
+
+    batcher = RatingBatcher(apply, interval=args.interval_ms / 1000, max_events=args.batch_size)
+    start = run_clients(lambda appid: batcher.add(appid, 1, 0))
+    batcher.close()
+    batched_rate = per_thread * args.threads / (time.perf_counter() - start)
+    stats = batcher.stats()
+
+    apply({appid: (-votes, 0) for appid, votes in cast.items()})
+    writer.close()
+    print(f"{args.threads} clients, {per_thread * args.threads} votes per mode")
+    print(f"direct   {direct_rate:10.0f} votes/s")
+    print(f"batched  {batched_rate:10.0f} votes/s   {stats['batches']} batches, "
+          f"{stats['avg_batch_votes']} votes/batch, {stats['flush_avg_ms']} ms/flush")
+
+
+def bench_hot_votes(args):
+    """Votes per second on one game: UPDATEs of its steam row vs. sharded counters vs. the event log.
+
+    Writes: --threads clients, each on its own connection, cast --votes
+    positive votes in total for the most-owned game in each mode. The
+    deferred votes are rolled up, then all of them are taken back off.
+    """
+    conn = connect(DB_CREDENTIALS, DB_SCHEMA)
+    (appid,), = conn.run("SELECT appid FROM steam ORDER BY owners_low DESC, appid LIMIT 1")
+    conn.rollback()
+    cache = StatementCache(STATEMENTS)
+    per_thread = args.votes // args.threads
+
+    def run_clients(vote):
+        clients = [connect(DB_CREDENTIALS, DB_SCHEMA) for _ in range(args.threads)]
+        latencies = [[] for _ in clients]
+
+        def client(i):
+            for _ in range(per_thread):
+                start = time.perf_counter()
+                vote(clients[i])
+                latencies[i].append((time.perf_counter() - start) * 1000)
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(args.threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        rate = per_thread * args.threads / (time.perf_counter() - start)
+        for client_conn in clients:
+            client_conn.close()
+        return rate, [ms for samples in latencies for ms in samples]
+
+    def direct(client_conn):
+        cache.run(client_conn, 'rating_positive_add', appid=appid)
+        client_conn.commit()
+
+    def sharded(client_conn):
+        cast_sharded_vote(client_conn, cache, appid, 1, 0, shards=args.shards)
+
+    def logged(client_conn):
+        cast_logged_vote(client_conn, cache, appid, 1, 0)
+
+    direct_rate, direct_ms = run_clients(direct)
+    sharded_rate, sharded_ms = run_clients(sharded)
+    logged_rate, logged_ms = run_clients(logged)
+
+    start = time.perf_counter()
+    rollup_shards(conn, cache)
+    shards_rollup_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    rollup_events(conn, cache)
+    events_rollup_ms = (time.perf_counter() - start) * 1000
+    cache.run(conn, 'rating_batch', appids=[appid], positive=[-3 * per_thread * args.threads], negative=[0])
+    conn.commit()
+    conn.close()
+    print(f"{args.threads} clients, {per_thread * args.threads} votes per mode on appid {appid}")
+    print(f"direct            {direct_rate:10.0f} votes/s   {summary(direct_ms)}")
+    print(f"sharded (x{args.shards:<3})   {sharded_rate:10.0f} votes/s   {summary(sharded_ms)}")
+    print(f"event log         {logged_rate:10.0f} votes/s   {summary(logged_ms)}")
+    print(f"rollup            shards {shards_rollup_ms:.3f} ms, events {events_rollup_ms:.3f} ms")
+
+
+SUPPORT_CSV = pathlib.Path(__file__).parent / "steam_support_info.csv"
+
+# Appid offset between the copies of the support file; above every real appid
+SUPPORT_COPY_STRIDE = 10_000_000
+
+
+def bench_support_load(args):
+    """COPY load throughput and peak memory for steam_support_info.csv at --copies times its size.
+
+    Writes: loads the real rows into steam_support, plus every copy under
+    appids shifted by SUPPORT_COPY_STRIDE, and deletes the copies afterwards.
+    """
+    with open(SUPPORT_CSV, newline='', encoding='utf-8') as source:
+        rows = list(csv.reader(source))[1:]
+    with tempfile.NamedTemporaryFile('w', newline='', encoding='utf-8', suffix='.csv') as synthetic:
+        writer = csv.writer(synthetic)
+        writer.writerow(SUPPORT_FIELDS)
+        for copy in range(args.copies):
+            for appid, *links in rows:
+                writer.writerow((int(appid) + copy * SUPPORT_COPY_STRIDE, *links))
+        synthetic.flush()
+        size_mb = synthetic.tell() / 1e6
+
+        conn = connect(DB_CREDENTIALS, DB_SCHEMA)
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        with open(synthetic.name, newline='', encoding='utf-8') as lines:
+            report = load_support(conn, lines, StatementCache(STATEMENTS))
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    conn.run("DELETE FROM steam_support WHERE appid >= :stride", stride=SUPPORT_COPY_STRIDE)
+    conn.commit()
+    conn.close()
+    print(f"{report['rows']} rows ({size_mb:.1f} MB) in {report['seconds']} s: {report['rows_per_s']} rows/s, "
+          f"{report['rejected']} rejected")
+    print(f"peak RSS grew by {(rss_after - rss_before) / 1024:.1f} MB during the load")
+
+
+def bench_steam_load(args):
+    """Parallel chunked load of a --rows synthetic copy of steam, with peak memory.
+
+    Writes: builds an empty steam_bench table like steam, rebuilds it from
+    the synthetic file with loaders.load_steam() and drops it afterwards.
+    Copies of the real rows get appids shifted past every real one.
+    """
+    conn = connect(DB_CREDENTIALS, DB_SCHEMA)
+    columns = [name for (name,) in conn.run("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_name = 'steam' AND table_schema = current_schema()
+          AND is_generated = 'NEVER' AND column_name <> 'search_document'
+        ORDER BY ordinal_position
+    """)]
+    dump = io.StringIO()
+    conn.run(f"COPY (SELECT {', '.join(columns)} FROM steam) TO STDOUT WITH (FORMAT csv)", stream=dump)
+    (stride,), = conn.run("SELECT MAX(appid) + 1 FROM steam")
+    conn.run("DROP TABLE IF EXISTS steam_bench")
+    conn.run("CREATE TABLE steam_bench (LIKE steam INCLUDING ALL)")
+    conn.commit()
+    rows = list(csv.reader(io.StringIO(dump.getvalue())))
+    appid = columns.index('appid')
+
+    with tempfile.NamedTemporaryFile('w', newline='', encoding='utf-8', suffix='.csv') as synthetic:
+        writer = csv.writer(synthetic)
+        writer.writerow(columns)
+        for n, row in enumerate(itertools.islice(itertools.cycle(rows), args.rows)):
+            row = list(row)
+            row[appid] = int(row[appid]) + n // len(rows) * stride
+            writer.writerow(row)
+        synthetic.flush()
+        size_mb = synthetic.tell() / 1e6
+        del rows, dump
+
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        report = load_steam(DB_CREDENTIALS, DB_SCHEMA, synthetic.name, table='steam_bench',
+                            workers=args.workers, connections=args.connections)
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    conn.run("DROP TABLE IF EXISTS steam_bench")
+    conn.commit()
+    conn.close()
+    print(f"{report['rows']} rows ({size_mb:.0f} MB) in {report['seconds']} s: {report['rows_per_s']} rows/s "
+          f"({report['load_seconds']} s COPY, {report['index_seconds']} s indexes), {report['rejected']} rejected")
+    print(f"peak RSS of the loading process grew by {(rss_after - rss_before) / 1024:.1f} MB")
+
+
+BENCHMARKS = {
+    'statements': bench_statements,
+    'pagination': bench_pagination,
+    'rating': bench_rating,
+    'trigram': bench_trigram,
+    'name_index': bench_name_index,
+    'autocomplete': bench_autocomplete,
+    'fulltext': bench_fulltext,
+    'votes': bench_votes,
+    'hot_votes': bench_hot_votes,
+    'support_load': bench_support_load,
+    'steam_load': bench_steam_load,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=50, help="iterations per measurement")
+    parser.add_argument('--term', default="the", help="search term for ILIKE queries")
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--pages', type=int, default=200, help="how deep to page")
+    parser.add_argument('--sizes', default="27000,1000000,10000000", help="comma-separated table sizes")
+    parser.add_argument('--terms', default="war,simulator,zzqx", help="comma-separated search terms")
+    parser.add_argument('--votes', type=int, default=5000, help="votes cast per mode")
+    parser.add_argument('--threads', type=int, default=8, help="concurrent voting clients")
+    parser.add_argument('--interval-ms', type=float, default=5, help="write-behind flush interval")
+    parser.add_argument('--rows', type=int, default=10_000_000, help="rows in the synthetic steam file")
+    parser.add_argument('--workers', type=int, help="parser processes for steam_load; default: one per CPU")
+    parser.add_argument('--connections', type=int, default=4, help="concurrent COPY connections for steam_load")
+    parser.add_argument('--copies', type=int, default=100, help="size of the synthetic support file, in copies")
+    parser.add_argument('--shards', type=int, default=16, help="counter rows per game for sharded votes")
+    parser.add_argument('--batch-size', type=int, default=500, help="votes that force a write-behind flush")
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
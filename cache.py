@@ -0,0 +1,220 @@
+"""In-process caches for query results, and coalescing of identical queries."""
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def row_appids(rows):
+    """Appids of result rows whose last column is appid"""
+    return {row[-1] for row in rows}
+
+
+def estimate_size(value):
+    """Rough size in bytes of a list of result rows (or any object holding ``rows``)"""
+    rows = getattr(value, 'rows', value)
+    size = sys.getsizeof(rows)
+    if not isinstance(rows, (list, tuple)):
+        return size
+    for row in rows:
+        size += sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row)
+    return size
+
+
+class _Call:
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it
+    is still running wait for it and get the same result, or the same
+    exception. Once it returns the key is free again, so nothing is cached.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+            }
+
+
+class _Entry:
+    __slots__ = ('value', 'appids', 'size', 'expires')
+
+    def __init__(self, value, appids, size, expires):
+        self.value = value
+        self.appids = appids
+        self.size = size
+        self.expires = expires
+
+
+class ResultCache:
+    """LRU cache of query results bounded by total size in bytes, with a TTL.
+
+    Each entry remembers the appids of the games it contains, so a change to
+    one game only drops the entries that show it. The cache is per process:
+    other workers see the change once their copy expires.
+
+    Concurrent misses on the same key are coalesced, so an expired popular
+    entry is recomputed once rather than by every request that wanted it.
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, ttl=300.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()   # key -> _Entry, least recently used first
+        self._by_appid = {}             # appid -> set of keys
+        self._bytes = 0
+        self._invalidation_seq = 0
+        self._invalidated = {}          # appid -> sequence number of its latest invalidation
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        for appid in entry.appids:
+            keys = self._by_appid.get(appid)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_appid[appid]
+        return entry
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            if entry.expires <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def put(self, key, value, appids=()):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(value, frozenset(appids), size, time.monotonic() + self.ttl)
+            self._bytes += size
+            for appid in appids:
+                self._by_appid.setdefault(appid, set()).add(key)
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute, appids_of=row_appids):
+        """Cached value for ``key``, calling ``compute()`` and caching its result on a miss.
+
+        A result is not cached if one of its games was invalidated while it
+        was being computed, since it may predate that change.
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+
+        def fill():
+            started = self._invalidation_seq
+            value = compute()
+            appids = appids_of(value)
+            with self._lock:
+                stale = any(self._invalidated.get(appid, -1) >= started for appid in appids)
+            if not stale:
+                self.put(key, value, appids)
+            return value
+
+        return self._flights.do(key, fill)
+
+    def invalidate_appids(self, appids):
+        """Drop every entry that contains one of ``appids``"""
+        with self._lock:
+            seq = self._invalidation_seq
+            self._invalidation_seq += 1
+            keys = set()
+            for appid in appids:
+                self._invalidated[appid] = seq
+                keys.update(self._by_appid.get(appid, ()))
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_appid.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_s': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'coalesced': self._flights.coalesced,
+            }
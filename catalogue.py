@@ -0,0 +1,183 @@
+"""In-memory snapshot of the catalogue with every listing sort precomputed.
+
+The full-catalogue Quick Actions and the home page otherwise make Postgres
+order the whole table on each request. A snapshot keeps one permutation of
+row ids per key in queries.SORTS, so a page is a slice of an array. Pages use
+the same cursors as pagination.fetch_page(), which makes the two
+interchangeable.
+"""
+import itertools
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+
+from facets import FacetIndex, bitmap, list_values, price_band, row_ids
+from pagination import PAGE_SIZE, decode_cursor, make_page
+from queries import SORTS
+
+# Snapshot row layout, as selected by STATEMENTS['catalogue']
+(APPID, NAME, RELEASE_DATE, PRICE, REVIEW_SCORE, OWNERS_LOW, OWNERS_HIGH,
+ PLATFORMS, GENRES, CATEGORIES, REQUIRED_AGE) = range(11)
+
+
+def _ordinal(value):
+    if not isinstance(value, date):
+        value = date.fromisoformat(value)
+    return value.toordinal()
+
+
+# Sort key -> (sort value of a snapshot row, conversion of a sort value to a
+# number or string). Sort values must equal the SQL sort columns in
+# queries.SORTS so that cursors mean the same thing in both places.
+SORT_VALUES = {
+    'appid': (lambda row: row[APPID], int),
+    'newest': (lambda row: row[RELEASE_DATE], _ordinal),
+    'rating': (lambda row: -1 if row[REVIEW_SCORE] is None else row[REVIEW_SCORE], float),
+    'price': (lambda row: row[PRICE], float),
+    'player_count': (lambda row: row[OWNERS_LOW], int),
+    'name': (lambda row: row[NAME], str),
+}
+
+# Row predicates matching queries.SORT_FILTERS, given the same parameters
+SORT_FILTERS = {
+    'player_count': lambda row, p: row[OWNERS_LOW] >= p['min_owners'] and row[OWNERS_HIGH] <= p['max_owners'],
+}
+
+
+def facet_values(row):
+    """facets.FACETS facet -> values of a snapshot row"""
+    band = price_band(row[PRICE])
+    return {
+        'price': [band] if band else [],
+        'year': [str(row[RELEASE_DATE].year)] if row[RELEASE_DATE] else [],
+        'platforms': list_values(row[PLATFORMS]),
+        'genres': list_values(row[GENRES]),
+        'categories': list_values(row[CATEGORIES]),
+        'required_age': [] if row[REQUIRED_AGE] is None else [str(row[REQUIRED_AGE])],
+    }
+
+
+def position_key(sort, value, appid):
+    """Key ordering (sort value, appid) positions ascending in the listing's order.
+
+    Descending sorts negate their value, so every listing is kept as an
+    ascending list. NULLs go last ascending and first descending, as in
+    Postgres.
+    """
+    ascending = SORTS[sort][1] == "ASC"
+    if value is None:
+        return (1, 0, appid) if ascending else (0, 0, -appid)
+    value = SORT_VALUES[sort][1](value)
+    return (0, value, appid) if ascending else (1, -value, -appid)
+
+
+class Catalogue:
+    """Rows of every game plus, per sort, row ids in listing order.
+
+    ``rows`` are tuples in the STATEMENTS['catalogue'] layout. A rating
+    change is applied with :meth:`set_review_score`, which moves that one
+    game within the 'By Rating' order rather than re-sorting it. ``facets``
+    holds facet bitmaps over the same row ids.
+    """
+
+    def __init__(self, rows):
+        start = time.perf_counter()
+        self.rows = [tuple(row) for row in rows]
+        self.row_of = {row[APPID]: i for i, row in enumerate(self.rows)}
+        self.order = {}
+        self.keys = {}
+        for sort, (value_of, _) in SORT_VALUES.items():
+            keyed = sorted((position_key(sort, value_of(row), row[APPID]), i) for i, row in enumerate(self.rows))
+            self.keys[sort] = [key for key, _ in keyed]
+            self.order[sort] = array('i', (i for _, i in keyed))
+        self.facets = FacetIndex(facet_values(row) for row in self.rows)
+        self.built_at = time.monotonic()
+        self.build_seconds = time.perf_counter() - start
+        self._lock = threading.Lock()
+
+        self.pages = 0
+        self.repairs = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _listing_row(self, sort, i):
+        """A row shaped like the SQL page statements': game columns, sort_value, appid"""
+        row = self.rows[i]
+        return (row[NAME], row[RELEASE_DATE], row[PRICE], row[REVIEW_SCORE], SORT_VALUES[sort][0](row), row[APPID])
+
+    def _cursor_key(self, sort, cursor):
+        sort_value, appid = decode_cursor(sort, cursor)
+        try:
+            return position_key(sort, sort_value, appid)
+        except (TypeError, ValueError) as e:
+            # A value of the wrong type for this sort, e.g. a number where a date belongs
+            raise ValueError("invalid page cursor") from e
+
+    def bitmap_of(self, appids):
+        """Bitset of the row ids of ``appids``, for combining with facet bitmaps"""
+        return bitmap((self.row_of[appid] for appid in appids if appid in self.row_of), len(self.rows))
+
+    def appids_of(self, bits):
+        """Appids of the row ids set in a bitset"""
+        return {self.rows[i][APPID] for i in row_ids(bits, len(self.rows))}
+
+    def page(self, sort, after=None, before=None, page_size=PAGE_SIZE, filters=None, rows_in=None):
+        """One page of ``sort``; the same contract as pagination.fetch_page().
+
+        ``rows_in`` is an optional bitset restricting the page to those row ids.
+        """
+        accept = SORT_FILTERS.get(sort) if filters else None
+        bits = rows_in.to_bytes((len(self.rows) + 7) // 8, 'little') if rows_in is not None else None
+        with self._lock:
+            order, keys = self.order[sort], self.keys[sort]
+            if after:
+                positions = range(bisect_right(keys, self._cursor_key(sort, after)), len(order))
+            elif before:
+                positions = range(bisect_left(keys, self._cursor_key(sort, before)) - 1, -1, -1)
+            else:
+                positions = range(len(order))
+            ids = (order[p] for p in positions)
+            if bits is not None:
+                ids = (i for i in ids if bits[i >> 3] >> (i & 7) & 1)
+            if accept is not None:
+                ids = (i for i in ids if accept(self.rows[i], filters))
+            rows = [self._listing_row(sort, i) for i in itertools.islice(ids, page_size + 1)]
+            self.pages += 1
+
+        if before:
+            return make_page(sort, rows[:page_size][::-1], True, len(rows) > page_size)
+        return make_page(sort, rows[:page_size], len(rows) > page_size, bool(after))
+
+    def set_review_score(self, appid, score):
+        """Record a game's new review_score and move it within the 'By Rating' order"""
+        with self._lock:
+            i = self.row_of.get(appid)
+            if i is None:
+                return
+            row = self.rows[i]
+            value_of, _ = SORT_VALUES['rating']
+            old_key = position_key('rating', value_of(row), appid)
+            self.rows[i] = row = row[:REVIEW_SCORE] + (score,) + row[REVIEW_SCORE + 1:]
+            new_key = position_key('rating', value_of(row), appid)
+
+            order, keys = self.order['rating'], self.keys['rating']
+            at = bisect_left(keys, old_key)
+            del keys[at]
+            del order[at]
+            at = bisect_left(keys, new_key)
+            keys.insert(at, new_key)
+            order.insert(at, i)
+            self.repairs += 1
+
+    def stats(self):
+        return {
+            'rows': len(self.rows),
+            'build_ms': round(self.build_seconds * 1000, 1),
+            'age_s': round(time.monotonic() - self.built_at, 1),
+            'pages': self.pages,
+            'repairs': self.repairs,
+            'facets': self.facets.stats(),
+        }
@@ -0,0 +1,16 @@
+"""Database settings shared by the web app and the command line tools"""
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Database credentials - in production, use environment variables
+DB_CREDENTIALS = {
+    'user': os.getenv('DB_USER'),
+    'password': os.getenv('DB_PASSWORD'),
+    'database': os.getenv('DB_NAME'),
+    'host': os.getenv('DB_HOST')
+}
+
+DB_SCHEMA = os.getenv('DB_SCHEMA', 'maxwell_lamb')
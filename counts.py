@@ -0,0 +1,96 @@
+"""Counts for the 'Count' action without a COUNT(*) on every click."""
+import json
+import threading
+import time
+from collections import namedtuple
+
+from search_index import normalize, trigrams
+
+# ``exact`` is False for planner estimates
+Count = namedtuple('Count', 'value exact')
+
+
+def planner_estimate(conn, sql, **params):
+    """Rows the planner expects ``sql`` to return, read from EXPLAIN without running it"""
+    (plan,), = conn.run(f"EXPLAIN (FORMAT JSON) {sql}", **params)
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class CountService:
+    """The catalogue total, and counts of games whose name contains a term.
+
+    The total is counted once and then kept current with :meth:`adjust_total`
+    by whatever inserts or deletes games. It is recounted after ``total_ttl``
+    seconds so that changes made elsewhere are picked up. Term counts are
+    exact and cached in ``cache`` per normalized term. A term with no
+    3-character run can't use the trigram index, so counting it scans the
+    table; unless the in-memory name index can answer, such terms get the
+    planner's estimate instead.
+
+    ``count_all()``, ``count_matching(term)`` and ``estimate_matching(term)``
+    do the database work.
+    """
+
+    def __init__(self, count_all, count_matching, estimate_matching, cache, total_ttl=300.0):
+        self.count_all = count_all
+        self.count_matching = count_matching
+        self.estimate_matching = estimate_matching
+        self.cache = cache
+        self.total_ttl = total_ttl
+        self._total = None
+        self._counted_at = 0.0
+        self._lock = threading.Lock()
+
+        self.recounts = 0
+        self.estimates = 0
+
+    def total(self):
+        """Count of every game; always exact"""
+        with self._lock:
+            if self._total is None or time.monotonic() - self._counted_at >= self.total_ttl:
+                self._total = self.count_all()
+                self._counted_at = time.monotonic()
+                self.recounts += 1
+            return Count(self._total, True)
+
+    def adjust_total(self, delta):
+        """Record ``delta`` games added (or removed, if negative) since the last count"""
+        with self._lock:
+            if self._total is not None:
+                self._total += delta
+
+    def reset_total(self):
+        """Forget the total, so that the next call counts again"""
+        with self._lock:
+            self._total = None
+
+    def matching(self, term, name_index=None):
+        """Count of games whose name contains ``term``.
+
+        With a built ``name_index`` the count is taken from memory.
+        """
+        key = ('count', normalize(term))
+        if name_index is None and not trigrams(normalize(term)):
+            cached = self.cache.get(key)
+            if cached is not None:
+                return Count(cached, True)
+            self.estimates += 1
+            return Count(self.estimate_matching(term), False)
+
+        def count():
+            if name_index is not None:
+                return len(name_index.search(term))
+            return self.count_matching(term)
+
+        # Counts hold no game rows, so rating changes never touch them
+        return Count(self.cache.get_or_compute(key, count, appids_of=lambda value: ()), True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'total': self._total,
+                'recounts': self.recounts,
+                'estimates': self.estimates,
+            }
@@ -0,0 +1,331 @@
+import itertools
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+import pg8000
+
+
+def connect(credentials, search_path=None):
+    """Open a pg8000 connection with ``search_path`` set for the whole session"""
+    conn = pg8000.connect(**credentials)
+    try:
+        if search_path:
+            conn.run(f"SET search_path TO {search_path}")
+            # SET is transactional, so commit it to make it stick for the session
+            conn.commit()
+    except Exception:
+        conn.close()
+        raise
+    return conn
+
+
+class PoolTimeout(pg8000.InterfaceError):
+    """Raised when no connection becomes available before the checkout timeout"""
+
+
+class _PoolEntry:
+    """Book-keeping for one physical connection owned by the pool"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created = time.monotonic()
+        self.last_used = self.created
+
+    def age(self, now=None):
+        return (now or time.monotonic()) - self.created
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of pg8000 connections.
+
+    Connections are created lazily up to ``maxconn``. The schema search_path is
+    set once when a connection is opened, any open transaction is rolled back
+    when a connection is returned, and connections that sat idle for longer
+    than ``health_check_after`` seconds are pinged before being handed out.
+    """
+
+    def __init__(self, credentials, search_path=None, minconn=0, maxconn=10,
+                 timeout=30.0, max_lifetime=3600.0, health_check_after=30.0):
+        if maxconn < 1 or minconn > maxconn:
+            raise ValueError("pool size must satisfy 0 <= minconn <= maxconn >= 1")
+        self.credentials = credentials
+        self.search_path = search_path
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+
+        self._cond = threading.Condition()
+        self._idle = []        # LIFO stack of _PoolEntry, most recently used last
+        self._in_use = {}      # id(conn) -> _PoolEntry
+        self._opening = 0      # connections being opened outside the lock
+        self._closed = False
+
+        self._checkouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._timeouts = 0
+        self._created = 0
+        self._discarded = 0
+
+    # -- connection lifecycle -------------------------------------------------
+
+    def _open(self):
+        return _PoolEntry(connect(self.credentials, self.search_path))
+
+    def _close(self, entry):
+        self._discarded += 1
+        try:
+            entry.conn.close()
+        except Exception:
+            pass
+
+    def _healthy(self, entry):
+        try:
+            entry.conn.run("SELECT 1")
+            entry.conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def warm_up(self):
+        """Open connections until ``minconn`` are available"""
+        while True:
+            with self._cond:
+                if self._size() >= self.minconn:
+                    return
+                self._opening += 1
+            try:
+                entry = self._open()
+            except Exception:
+                with self._cond:
+                    self._opening -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._opening -= 1
+                self._created += 1
+                self._idle.append(entry)
+                self._cond.notify()
+
+    def _size(self):
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def getconn(self, timeout=None):
+        """Check a connection out of the pool, waiting up to ``timeout`` seconds"""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+
+        while True:
+            entry = None
+            open_new = False
+            with self._cond:
+                if self._closed:
+                    raise pg8000.InterfaceError("connection pool is closed")
+                while not self._idle and self._size() >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(f"no database connection available after {timeout:.1f}s")
+                    self._cond.wait(remaining)
+                if self._idle:
+                    entry = self._idle.pop()
+                else:
+                    self._opening += 1
+                    open_new = True
+
+            if open_new:
+                try:
+                    entry = self._open()
+                except Exception:
+                    with self._cond:
+                        self._opening -= 1
+                        self._cond.notify()
+                    raise
+            else:
+                now = time.monotonic()
+                expired = entry.age(now) > self.max_lifetime
+                stale = now - entry.last_used > self.health_check_after
+                if expired or (stale and not self._healthy(entry)):
+                    with self._cond:
+                        self._close(entry)
+                        self._cond.notify()
+                    continue
+
+            waited = time.monotonic() - start
+            with self._cond:
+                if open_new:
+                    self._opening -= 1
+                    self._created += 1
+                self._in_use[id(entry.conn)] = entry
+                self._checkouts += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+            return entry.conn
+
+    def putconn(self, conn, discard=False):
+        """Return a connection to the pool, rolling back any open transaction"""
+        with self._cond:
+            entry = self._in_use.pop(id(conn), None)
+        if entry is None:
+            raise pg8000.InterfaceError("connection does not belong to this pool")
+
+        if not discard:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+
+        with self._cond:
+            if discard or self._closed or entry.age() > self.max_lifetime:
+                self._close(entry)
+            else:
+                entry.last_used = time.monotonic()
+                self._idle.append(entry)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager that checks a connection out and always returns it"""
+        conn = self.getconn(timeout)
+        discard = False
+        try:
+            yield conn
+        except pg8000.InterfaceError:
+            # The socket is most likely gone; don't hand it to the next request
+            discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def close(self):
+        """Close idle connections and refuse further checkouts"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            for entry in idle:
+                self._close(entry)
+            self._cond.notify_all()
+
+    # -- reporting ------------------------------------------------------------
+
+    def stats(self):
+        """Snapshot of pool size, checkout wait times and connection ages"""
+        with self._cond:
+            now = time.monotonic()
+            ages = [e.age(now) for e in self._idle] + [e.age(now) for e in self._in_use.values()]
+            return {
+                'size': len(ages),
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'max_size': self.maxconn,
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'connections_created': self._created,
+                'connections_closed': self._discarded,
+                'wait_avg_ms': round(self._wait_total / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+                'wait_max_ms': round(self._wait_max * 1000, 3),
+                'age_max_s': round(max(ages), 1) if ages else 0.0,
+                'age_avg_s': round(sum(ages) / len(ages), 1) if ages else 0.0,
+            }
+
+
+class StatementCache:
+    """Per-connection registry of named server-side prepared statements.
+
+    ``statements`` maps a short name to SQL written in pg8000's named
+    parameter style. Each statement is parsed and planned on its first use on
+    a physical connection, and is then reused for every request that checks
+    that connection out. Statements that are never run on a connection are
+    never prepared there, so those of optional tables cost nothing until used.
+    """
+
+    def __init__(self, statements):
+        self.statements = dict(statements)
+        self._prepared = weakref.WeakKeyDictionary()   # conn -> {name: PreparedStatement}
+        self._lock = threading.Lock()
+        self.prepares = 0
+        self.executions = 0
+
+    def _get(self, conn, name):
+        with self._lock:
+            prepared = self._prepared.setdefault(conn, {})
+        ps = prepared.get(name)
+        if ps is None:
+            # A connection is only ever used by one thread at a time, so no lock is needed here
+            ps = prepared[name] = conn.prepare(self.statements[name])
+            self.prepares += 1
+        return ps
+
+    def run(self, conn, name, /, **params):
+        """Execute a registered statement and return all of its rows"""
+        self.executions += 1
+        return self._get(conn, name).run(**params)
+
+    def columns(self, conn, name):
+        """Names of the columns a registered statement returns"""
+        # pg8000.legacy.PreparedStatement keeps the row description it got from DESCRIBE
+        return [column['name'] for column in self._get(conn, name).row_desc]
+
+    def stats(self):
+        with self._lock:
+            connections = len(self._prepared)
+        return {
+            'statements': len(self.statements),
+            'connections': connections,
+            'prepares': self.prepares,
+            'executions': self.executions,
+        }
+
+
+_cursor_ids = itertools.count()
+
+
+class RowStream:
+    """Rows of a query pulled in bounded batches from a server-side cursor.
+
+    The cursor is declared and the first batch fetched on construction, so
+    SQL errors surface before a response starts and the stream is truthy
+    exactly when the query returned at least one row. Iterating fetches the
+    remaining batches with ``FETCH FORWARD``; at most ``batch_size`` rows are
+    held in memory at once. The cursor lives in the connection's current
+    transaction and is discarded when the pool rolls the connection back.
+    """
+
+    def __init__(self, conn, sql, batch_size=500, **params):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.name = f"row_stream_{next(_cursor_ids)}"
+        self.rows = 0
+        self.batches = 0
+        conn.run(f"DECLARE {self.name} NO SCROLL CURSOR FOR {sql}", **params)
+        self._open = True
+        self._batch = self._fetch()
+        self._nonempty = bool(self._batch)
+
+    def _fetch(self):
+        batch = self.conn.run(f"FETCH FORWARD {self.batch_size} FROM {self.name}")
+        self.rows += len(batch)
+        self.batches += 1
+        return batch
+
+    def __bool__(self):
+        return self._nonempty
+
+    def __iter__(self):
+        batch, self._batch = self._batch, ()
+        while batch:
+            yield from batch
+            if len(batch) < self.batch_size:
+                break
+            batch = self._fetch()
+        self.close()
+
+    def close(self):
+        if self._open:
+            self._open = False
+            self.conn.run(f"CLOSE {self.name}")
@@ -0,0 +1,586 @@
+"""Bulk loaders for the dataset files shipped with the app.
+
+Files are parsed as they are read and streamed to Postgres through COPY
+FROM STDIN, so memory use stays bounded by a few chunks whatever the file
+size.
+"""
+import contextlib
+import csv
+import datetime
+import hashlib
+import io
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pg8000
+
+from db import connect
+
+# Bytes of CSV sent per COPY data message
+COPY_CHUNK_BYTES = 64 * 1024
+
+# Largest value of a Postgres integer column
+MAX_INTEGER = 2 ** 31 - 1
+
+SUPPORT_FIELDS = ('steam_appid', 'website', 'support_url', 'support_email')
+
+
+class CopyFeed:
+    """CSV chunks for COPY FROM STDIN, written lazily from parsed rows.
+
+    ``rows`` yields tuples of column values; None is written as an empty,
+    unquoted field, which COPY reads as NULL. An error raised by ``rows``
+    ends the feed cleanly instead of raising inside pg8000's COPY loop,
+    which would leave the connection mid-protocol; it is kept in ``error``
+    for the caller to raise once COPY has finished.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.count = 0
+        self.error = None
+
+    def __iter__(self):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        try:
+            for row in self.rows:
+                writer.writerow(row)
+                self.count += 1
+                if buffer.tell() >= COPY_CHUNK_BYTES:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+        except Exception as e:
+            self.error = e
+            return
+        if buffer.tell():
+            yield buffer.getvalue()
+
+
+class Rejects:
+    """Side file of rows a loader could not use, written on first reject.
+
+    Each reject is written as its line number, the reason and the fields as
+    they were read.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._file = None
+        self._writer = None
+
+    def add(self, line, reason, fields):
+        self.count += 1
+        if self.path is None:
+            return
+        if self._writer is None:
+            self._file = open(self.path, 'w', newline='', encoding='utf-8')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(('line', 'reason', 'fields'))
+        self._writer.writerow((line, reason, *fields))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def _appid(value):
+    appid = int(value)
+    if not 0 <= appid <= MAX_INTEGER:
+        raise ValueError(f"appid out of range: {value}")
+    return appid
+
+
+def parse_support(lines, rejects):
+    """(line, appid, website, support_url, support_email) rows of steam_support_info.csv.
+
+    ``line`` is the file line the row ends on. A leading header row is
+    skipped, empty fields become None, and rows with the wrong number of
+    fields, a non-integer appid, a NUL character or broken quoting go to
+    ``rejects`` instead.
+    """
+    reader = csv.reader(lines)
+    while True:
+        try:
+            fields = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            rejects.add(reader.line_num, str(e), ())
+            continue
+        line = reader.line_num
+        if not fields:
+            continue
+        if line == 1 and tuple(name.strip() for name in fields) == SUPPORT_FIELDS:
+            continue
+        if len(fields) != len(SUPPORT_FIELDS):
+            rejects.add(line, f"expected {len(SUPPORT_FIELDS)} fields, got {len(fields)}", fields)
+            continue
+        if any('\0' in value for value in fields):
+            rejects.add(line, "NUL character", fields)
+            continue
+        try:
+            appid = _appid(fields[0])
+        except ValueError as e:
+            rejects.add(line, str(e), fields)
+            continue
+        yield (line, appid, *(value.strip() or None for value in fields[1:]))
+
+
+def load_support(conn, lines, statements, rejects_path=None):
+    """Stream steam_support_info.csv into steam_support, upserting on appid.
+
+    Rows are COPY'd into support_staging and merged with one INSERT ... ON
+    CONFLICT, all in one transaction; when an appid appears more than once
+    the last row wins. Unusable rows are written to ``rejects_path``.
+    Returns a report dict.
+    """
+    start = time.perf_counter()
+    rejects = Rejects(rejects_path)
+    feed = CopyFeed(parse_support(lines, rejects))
+    try:
+        conn.run("COPY support_staging (line, appid, website, support_url, support_email) "
+                 "FROM STDIN WITH (FORMAT csv)", stream=feed)
+        if feed.error is not None:
+            raise feed.error
+        (upserted,), = statements.run(conn, 'support_upsert')
+        statements.run(conn, 'clear_support_staging')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        rejects.close()
+    seconds = time.perf_counter() - start
+    return {
+        'rows': feed.count,
+        'upserted': upserted,
+        'rejected': rejects.count,
+        'seconds': round(seconds, 3),
+        'rows_per_s': round(feed.count / seconds) if seconds else 0,
+    }
+
+
+# Postgres type -> parser of a CSV field; types not listed are loaded as text
+def _integer(bits):
+    def parse(value):
+        number = int(value)
+        if not -2 ** (bits - 1) <= number < 2 ** (bits - 1):
+            raise ValueError(f"out of range: {value}")
+        return number
+    return parse
+
+
+FIELD_PARSERS = {
+    'smallint': _integer(16),
+    'integer': _integer(32),
+    'bigint': _integer(64),
+    'numeric': float,
+    'real': float,
+    'double precision': float,
+    'date': datetime.date.fromisoformat,
+}
+
+# Records per chunk handed to a parser process and COPY'd in one go
+CHUNK_ROWS = 50_000
+
+
+def split_records(lines, chunk_rows=CHUNK_ROWS):
+    """(first line number, text) chunks of ``chunk_rows`` CSV records.
+
+    Chunks end on record boundaries: a line with an odd number of quotes
+    opens or closes a quoted field, and records that continue over several
+    lines stay together. Only one chunk is held at a time.
+    """
+    chunk = []
+    records = 0
+    first = line_number = 1
+    in_quotes = False
+    for line in lines:
+        chunk.append(line)
+        line_number += 1
+        if line.count('"') % 2:
+            in_quotes = not in_quotes
+        if not in_quotes:
+            records += 1
+            if records >= chunk_rows:
+                yield first, ''.join(chunk)
+                chunk, records, first = [], 0, line_number
+    if chunk:
+        yield first, ''.join(chunk)
+
+
+def field_parsers(columns):
+    """(parser, nullable) per column from the (type, nullable) pairs of column_types()"""
+    return [(FIELD_PARSERS.get(data_type), nullable) for data_type, nullable in columns]
+
+
+def check_record(fields, parsers):
+    """Why a record can't be loaded into columns with these ``parsers``, or None if it can"""
+    if len(fields) != len(parsers):
+        return f"expected {len(parsers)} fields, got {len(fields)}"
+    try:
+        for value, (parse, nullable) in zip(fields, parsers):
+            if '\0' in value:
+                raise ValueError("NUL character")
+            if not value.strip():
+                if not nullable:
+                    raise ValueError("missing value")
+            elif parse is not None:
+                parse(value.strip())
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+def copy_values(fields, parsers):
+    """A checked record's values for COPY: blank non-text fields become NULL"""
+    return [value if value.strip() or parse is None else None for value, (parse, _) in zip(fields, parsers)]
+
+
+def parse_chunk(first_line, text, columns):
+    """Validate one chunk of records in a worker process.
+
+    ``columns`` are (type, nullable) pairs in file order. Returns the valid
+    records as CSV for COPY, their count, and (line, reason, fields) for
+    every rejected one.
+    """
+    parsers = field_parsers(columns)
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator='\n')
+    rows = 0
+    rejects = []
+    reader = csv.reader(io.StringIO(text, newline=''))
+    while True:
+        try:
+            fields = next(reader)
+        except StopIteration:
+            break
+        except csv.Error as e:
+            rejects.append((first_line + reader.line_num - 1, str(e), ()))
+            continue
+        line = first_line + reader.line_num - 1
+        if not fields:
+            continue
+        reason = check_record(fields, parsers)
+        if reason is not None:
+            rejects.append((line, reason, fields))
+            continue
+        writer.writerow(copy_values(fields, parsers))
+        rows += 1
+    return output.getvalue(), rows, rejects
+
+
+def _load_name(name):
+    # Identifiers are cut at 63 bytes; keep the suffix
+    return f"{name[:58]}_load"
+
+
+def prepare_load_table(conn, table):
+    """Create an empty ``{table}_load`` shaped like ``table``, without its indexes or constraints.
+
+    Defaults, generated columns and triggers are kept, so the loaded rows
+    come out as they would from INSERTs. Returns the (constraint name,
+    definition) pairs and the (index name, definition) pairs to build once
+    the rows are in.
+    """
+    load = _load_name(table)
+    conn.run(f"DROP TABLE IF EXISTS {load}")
+    conn.run(f"CREATE TABLE {load} (LIKE {table} INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING IDENTITY)")
+    for (definition,) in conn.run("""
+            SELECT pg_get_triggerdef(oid) FROM pg_trigger
+            WHERE tgrelid = CAST(:table AS regclass) AND NOT tgisinternal
+        """, table=table):
+        conn.run(re.sub(r" ON \S+ ", f" ON {load} ", definition, count=1))
+    constraints = conn.run("""
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = CAST(:table AS regclass) AND contype IN ('p', 'u', 'c', 'x', 'f')
+        ORDER BY contype = 'f', conname
+    """, table=table)
+    indexes = conn.run("""
+        SELECT index.relname, pg_get_indexdef(pg_index.indexrelid)
+        FROM pg_index JOIN pg_class AS index ON index.oid = pg_index.indexrelid
+        WHERE pg_index.indrelid = CAST(:table AS regclass)
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = pg_index.indexrelid)
+        ORDER BY index.relname
+    """, table=table)
+    conn.commit()
+    return constraints, indexes
+
+
+def column_types(conn, table, names):
+    """(type, nullable) of each named column of ``table``; ValueError for unknown or generated columns"""
+    found = {name: (data_type, nullable == 'YES') for name, data_type, nullable in conn.run("""
+        SELECT column_name, data_type, is_nullable FROM information_schema.columns
+        WHERE table_name = :table AND table_schema = current_schema() AND is_generated = 'NEVER'
+    """, table=table)}
+    conn.rollback()
+    unknown = [name for name in names if name not in found]
+    if unknown:
+        raise ValueError(f"columns not in {table} or not writable: {', '.join(unknown)}")
+    return [found[name] for name in names]
+
+
+def load_steam(credentials, search_path, path, table='steam', workers=None, connections=4,
+               chunk_rows=CHUNK_ROWS, rejects_path=None):
+    """Rebuild ``table`` from a CSV dump whose header names its columns.
+
+    Chunks of ``chunk_rows`` records are validated in a pool of ``workers``
+    processes and COPY'd into ``{table}_load`` over ``connections``
+    concurrent connections, each chunk in its own transaction. Only a
+    bounded window of chunks is in flight, so memory does not grow with the
+    file. Constraints are added once all rows are in and indexes are then
+    built in parallel; finally ``{table}_load`` replaces ``table`` in one
+    transaction. When ``table`` is steam, that transaction also drops the
+    content hashes refresh_steam() compares against and publishes the
+    reload in catalogue_refreshes. Invalid records go to ``rejects_path``.
+    Returns a report dict.
+    """
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    conn = connect(credentials, search_path)
+    load = _load_name(table)
+    rejects = Rejects(rejects_path)
+    local = threading.local()
+    clients = []
+    clients_lock = threading.Lock()
+
+    def client():
+        if not hasattr(local, 'conn'):
+            local.conn = connect(credentials, search_path)
+            with clients_lock:
+                clients.append(local.conn)
+        return local.conn
+
+    def copy(text):
+        copy_conn = client()
+        try:
+            copy_conn.run(copy_sql, stream=[text])
+            copy_conn.commit()
+        except Exception:
+            copy_conn.rollback()
+            raise
+
+    def build_index(definition):
+        index_conn = client()
+        index_conn.run(definition)
+        index_conn.commit()
+
+    rows = 0
+    try:
+        with open(path, newline='', encoding='utf-8') as source:
+            header = [name.strip() for name in next(csv.reader([source.readline()]))]
+            columns = column_types(conn, table, header)
+            constraints, indexes = prepare_load_table(conn, table)
+            copy_sql = f"COPY {load} ({', '.join(header)}) FROM STDIN WITH (FORMAT csv)"
+
+            with ProcessPoolExecutor(workers) as parsers, ThreadPoolExecutor(connections) as copiers:
+                parsing, copying = deque(), deque()
+
+                def hand_over():
+                    # Oldest parsed chunk to a COPY connection, in file order
+                    nonlocal rows
+                    text, count, chunk_rejects = parsing.popleft().result()
+                    rows += count
+                    for reject in chunk_rejects:
+                        rejects.add(*reject)
+                    copying.append(copiers.submit(copy, text))
+
+                # At most workers + 1 chunks are parsed and connections + 1 copied at a time
+                for first_line, text in split_records(source, chunk_rows):
+                    # Line numbers count the header too
+                    parsing.append(parsers.submit(parse_chunk, first_line + 1, text, columns))
+                    if len(parsing) > workers:
+                        hand_over()
+                    while len(copying) > connections:
+                        copying.popleft().result()
+                while parsing:
+                    hand_over()
+                while copying:
+                    copying.popleft().result()
+                loaded = time.perf_counter()
+
+                for name, definition in constraints:
+                    conn.run(f"ALTER TABLE {load} ADD CONSTRAINT {_load_name(name)} {definition}")
+                    conn.commit()
+                index_sql = [re.sub(r"^(CREATE (?:UNIQUE )?INDEX )\S+ ON (?:ONLY )?\S+ ",
+                                    rf"\g<1>{_load_name(name)} ON {load} ", definition, count=1)
+                             for name, definition in indexes]
+                for future in [copiers.submit(build_index, sql) for sql in index_sql]:
+                    future.result()
+        indexed = time.perf_counter()
+
+        conn.run(f"ALTER TABLE {table} RENAME TO {_load_name(table + '_old')}")
+        conn.run(f"ALTER TABLE {load} RENAME TO {table}")
+        conn.run(f"DROP TABLE {_load_name(table + '_old')}")
+        for name, _ in constraints:
+            conn.run(f"ALTER TABLE {table} RENAME CONSTRAINT {_load_name(name)} TO {name}")
+        for name, _ in indexes:
+            conn.run(f"ALTER INDEX {_load_name(name)} RENAME TO {name}")
+        if table == 'steam':
+            # The stored hashes describe the replaced rows
+            conn.run("TRUNCATE steam_hashes")
+            conn.run("INSERT INTO catalogue_refreshes (inserted, updated, deleted, reloaded) "
+                     "VALUES ('{}', '{}', '{}', true)")
+        conn.commit()
+        conn.run(f"ANALYZE {table}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        # Keep the original error if the connection is gone too
+        with contextlib.suppress(pg8000.Error):
+            conn.run(f"DROP TABLE IF EXISTS {load}")
+            conn.commit()
+        raise
+    finally:
+        rejects.close()
+        for client_conn in clients:
+            client_conn.close()
+        conn.close()
+    seconds = time.perf_counter() - start
+    return {
+        'rows': rows,
+        'rejected': rejects.count,
+        'load_seconds': round(loaded - start, 3),
+        'index_seconds': round(indexed - loaded, 3),
+        'seconds': round(seconds, 3),
+        'rows_per_s': round(rows / seconds) if seconds else 0,
+    }
+
+
+def record_hash(header, fields):
+    """Content hash of a dump record; any change to a value or to the column set changes it"""
+    content = '\x1f'.join(header) + '\x1e' + '\x1f'.join(value.strip() for value in fields)
+    return hashlib.blake2b(content.encode('utf-8'), digest_size=16).digest()
+
+
+def _hashed_records(reader, header, parsers, appid_at, rejects):
+    """(line, appid, hash) of every record; rejected records with a readable appid get a NULL hash"""
+    while True:
+        try:
+            fields = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            rejects.add(reader.line_num, str(e), ())
+            continue
+        if not fields:
+            continue
+        reason = check_record(fields, parsers)
+        if reason is None:
+            yield reader.line_num, int(fields[appid_at]), '\\x' + record_hash(header, fields).hex()
+            continue
+        rejects.add(reader.line_num, reason, fields)
+        try:
+            # Keeps the game as it is rather than deleting it as missing
+            yield reader.line_num, _appid(fields[appid_at]), None
+        except (ValueError, IndexError):
+            pass
+
+
+def _changed_records(reader, parsers, lines):
+    """COPY values of the records on ``lines``; the first pass already rejected unreadable ones"""
+    while True:
+        try:
+            fields = next(reader)
+        except StopIteration:
+            return
+        except csv.Error:
+            continue
+        if reader.line_num in lines:
+            yield copy_values(fields, parsers)
+
+
+def refresh_steam(conn, path, table='steam', rejects_path=None):
+    """Bring ``table`` in line with a new CSV dump, writing only the games that changed.
+
+    A first pass streams (line, appid, hash) of every record into a
+    temporary table; comparing it with steam_hashes gives the new and
+    changed games, whose records a second pass streams into a staging copy
+    of the table. One upsert and one anti-join DELETE then apply them, the
+    stored hashes follow, and the changed appids are recorded in
+    catalogue_refreshes, all in one transaction. Reading the dump is linear
+    in its size; everything written is linear in the number of changes.
+    The first refresh finds no stored hashes and rewrites every game once.
+    When an appid appears more than once the last record wins; a rejected
+    record leaves its game as it was. Returns a report dict with the
+    inserted, updated and deleted appids.
+    """
+    start = time.perf_counter()
+    rejects = Rejects(rejects_path)
+    try:
+        with open(path, newline='', encoding='utf-8') as source:
+            reader = csv.reader(source)
+            header = [name.strip() for name in next(reader)]
+            if 'appid' not in header:
+                raise ValueError("the dump has no appid column")
+            parsers = field_parsers(column_types(conn, table, header))
+            conn.run("CREATE TEMP TABLE refresh_hashes (line bigint, appid integer, hash bytea) ON COMMIT DROP")
+            feed = CopyFeed(_hashed_records(reader, header, parsers, header.index('appid'), rejects))
+            conn.run("COPY refresh_hashes (line, appid, hash) FROM STDIN WITH (FORMAT csv)", stream=feed)
+            if feed.error is not None:
+                raise feed.error
+            conn.run("ANALYZE refresh_hashes")
+            conn.run("""
+                CREATE TEMP TABLE refresh_changed ON COMMIT DROP AS
+                SELECT latest.appid, latest.line, latest.hash
+                FROM (SELECT DISTINCT ON (appid) appid, line, hash FROM refresh_hashes ORDER BY appid, line DESC)
+                     AS latest
+                LEFT JOIN steam_hashes AS stored USING (appid)
+                WHERE latest.hash IS NOT NULL AND latest.hash IS DISTINCT FROM stored.hash
+            """)
+            lines = {line for (line,) in conn.run("SELECT line FROM refresh_changed")}
+
+            source.seek(0)
+            reader = csv.reader(source)
+            next(reader)
+            conn.run(f"CREATE TEMP TABLE refresh_rows ON COMMIT DROP AS "
+                     f"SELECT {', '.join(header)} FROM {table} WITH NO DATA")
+            feed = CopyFeed(_changed_records(reader, parsers, lines))
+            conn.run(f"COPY refresh_rows ({', '.join(header)}) FROM STDIN WITH (FORMAT csv)", stream=feed)
+            if feed.error is not None:
+                raise feed.error
+
+        columns = ', '.join(header)
+        updates = ', '.join(f"{name} = EXCLUDED.{name}" for name in header if name != 'appid')
+        upserted = conn.run(f"""
+            INSERT INTO {table} ({columns}) SELECT {columns} FROM refresh_rows
+            ON CONFLICT (appid) DO UPDATE SET {updates}
+            RETURNING appid, xmax = 0
+        """)
+        deleted = sorted(appid for (appid,) in conn.run(f"""
+            DELETE FROM {table}
+            WHERE NOT EXISTS (SELECT 1 FROM refresh_hashes WHERE refresh_hashes.appid = {table}.appid)
+            RETURNING appid
+        """))
+        conn.run("""
+            INSERT INTO steam_hashes (appid, hash) SELECT appid, hash FROM refresh_changed
+            ON CONFLICT (appid) DO UPDATE SET hash = EXCLUDED.hash
+        """)
+        conn.run("DELETE FROM steam_hashes WHERE appid = ANY(:deleted::int[])", deleted=deleted)
+        inserted = sorted(appid for appid, was_inserted in upserted if was_inserted)
+        updated = sorted(appid for appid, was_inserted in upserted if not was_inserted)
+        if inserted or updated or deleted:
+            conn.run("INSERT INTO catalogue_refreshes (inserted, updated, deleted) "
+                     "VALUES (:inserted::int[], :updated::int[], :deleted::int[])",
+                     inserted=inserted, updated=updated, deleted=deleted)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        rejects.close()
+    seconds = time.perf_counter() - start
+    return {
+        'inserted': inserted,
+        'updated': updated,
+        'deleted': deleted,
+        'rejected': rejects.count,
+        'seconds': round(seconds, 3),
+    }
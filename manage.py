@@ -0,0 +1,168 @@
+"""Maintenance commands for the steam database.
+
+Usage:  python manage.py <command> [options]
+
+Commands read the same DB_* settings as app.py, from config.py.
+"""
+import argparse
+import json
+import pathlib
+import sys
+
+from config import DB_CREDENTIALS, DB_SCHEMA
+from db import connect, StatementCache
+from loaders import CHUNK_ROWS, load_support, load_steam, refresh_steam
+from queries import STATEMENTS
+from ratings import ingest_votes, rollup_shards, rollup_events, maintain_event_partitions
+
+MIGRATIONS_DIR = pathlib.Path(__file__).parent / "migrations"
+SUPPORT_CSV = pathlib.Path(__file__).parent / "steam_support_info.csv"
+
+
+def migrate(args):
+    """Apply pending migrations/*.sql files in name order, each in its own transaction"""
+    conn = connect(DB_CREDENTIALS, DB_SCHEMA)
+    conn.run("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            name text PRIMARY KEY,
+            applied_at timestamptz NOT NULL DEFAULT now()
+        )
+    """)
+    conn.commit()
+    applied = {name for (name,) in conn.run("SELECT name FROM schema_migrations")}
+    conn.rollback()
+
+    pending = [p for p in sorted(MIGRATIONS_DIR.glob("*.sql")) if p.name not in applied]
+    if not pending:
+        print("No pending migrations")
+    for path in pending:
+        print(f"Applying {path.name}")
+        if args.dry_run:
+            continue
+        try:
+            conn.run(path.read_text())
+            conn.run("INSERT INTO schema_migrations (name) VALUES (:name)", name=path.name)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    conn.close()
+
+
+def ingest(args):
+    """Apply rating votes in bulk from an NDJSON or CSV file of (appid, positive_delta, negative_delta)"""
+    fmt = args.format or ('csv' if args.path.endswith('.csv') else 'ndjson')
+    conn = connect(DB_CREDENTIALS, DB_SCHEMA)
+    lines = sys.stdin if args.path == '-' else open(args.path, newline='', encoding='utf-8')
+    try:
+        report = ingest_votes(conn, lines, fmt, StatementCache(STATEMENTS))
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+        conn.close()
+    print(f"{report['rows']} votes for {report['games']} games in {report['seconds']} s "
+          f"({report['rows_per_s']} rows/s); {report['unknown_games']} unknown appids skipped")
+
+
+def support(args):
+    """Load steam_support_info.csv (or another file of the same columns) into steam_support"""
+    rejects = args.rejects or f"{args.path}.rejects.csv"
+    conn = connect(DB_CREDENTIALS, DB_SCHEMA)
+    try:
+        with open(args.path, newline='', encoding='utf-8') as lines:
+            report = load_support(conn, lines, StatementCache(STATEMENTS), rejects_path=rejects)
+    finally:
+        conn.close()
+    print(f"{report['rows']} rows in {report['seconds']} s ({report['rows_per_s']} rows/s); "
+          f"{report['upserted']} inserted or changed")
+    if report['rejected']:
+        print(f"{report['rejected']} malformed rows written to {rejects}")
+
+
+def steam(args):
+    """Rebuild a table (default: steam) from a CSV dump whose header names its columns"""
+    rejects = args.rejects or f"{args.path}.rejects.csv"
+    report = load_steam(DB_CREDENTIALS, DB_SCHEMA, args.path, table=args.table, workers=args.workers,
+                        connections=args.connections, chunk_rows=args.chunk_rows, rejects_path=rejects)
+    print(f"{report['rows']} rows in {report['seconds']} s ({report['rows_per_s']} rows/s): "
+          f"{report['load_seconds']} s loading, {report['index_seconds']} s building indexes and constraints")
+    if report['rejected']:
+        print(f"{report['rejected']} malformed rows written to {rejects}")
+
+
+def refresh(args):
+    """Apply a new dump of steam incrementally: only games whose rows changed are written"""
+    rejects = args.rejects or f"{args.path}.rejects.csv"
+    conn = connect(DB_CREDENTIALS, DB_SCHEMA)
+    try:
+        report = refresh_steam(conn, args.path, table=args.table, rejects_path=rejects)
+    finally:
+        conn.close()
+    print(f"{len(report['inserted'])} inserted, {len(report['updated'])} updated, "
+          f"{len(report['deleted'])} deleted in {report['seconds']} s")
+    if report['rejected']:
+        print(f"{report['rejected']} malformed rows written to {rejects}; their games were left as they were")
+    if args.changes:
+        with open(args.changes, 'w', encoding='utf-8') as changes:
+            json.dump({key: report[key] for key in ('inserted', 'updated', 'deleted')}, changes)
+
+
+def rollup(args):
+    """Fold sharded counters and logged rating events into steam, and rotate event partitions"""
+    conn = connect(DB_CREDENTIALS, DB_SCHEMA)
+    cache = StatementCache(STATEMENTS)
+    try:
+        shards = rollup_shards(conn, cache)
+        events = rollup_events(conn, cache)
+        dropped = maintain_event_partitions(conn, keep_days=args.keep_days)
+    finally:
+        conn.close()
+    print(f"Rolled up shards of {len(shards)} games and events of {len(events)} games")
+    for name in dropped:
+        print(f"Dropped {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    cmd = commands.add_parser('migrate', help=migrate.__doc__)
+    cmd.add_argument('--dry-run', action='store_true', help="only list pending migrations")
+    cmd.set_defaults(func=migrate)
+
+    cmd = commands.add_parser('ingest-votes', help=ingest.__doc__)
+    cmd.add_argument('path', help="file to read, or - for stdin")
+    cmd.add_argument('--format', choices=('ndjson', 'csv'), help="default: from the file extension")
+    cmd.set_defaults(func=ingest)
+
+    cmd = commands.add_parser('load-support', help=support.__doc__)
+    cmd.add_argument('path', nargs='?', default=str(SUPPORT_CSV))
+    cmd.add_argument('--rejects', help="where to write malformed rows; default: PATH.rejects.csv")
+    cmd.set_defaults(func=support)
+
+    cmd = commands.add_parser('load-steam', help=steam.__doc__)
+    cmd.add_argument('path')
+    cmd.add_argument('--table', default='steam')
+    cmd.add_argument('--workers', type=int, help="parser processes; default: one per CPU")
+    cmd.add_argument('--connections', type=int, default=4, help="concurrent COPY connections")
+    cmd.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help="records per chunk")
+    cmd.add_argument('--rejects', help="where to write malformed rows; default: PATH.rejects.csv")
+    cmd.set_defaults(func=steam)
+
+    cmd = commands.add_parser('refresh-steam', help=refresh.__doc__)
+    cmd.add_argument('path')
+    cmd.add_argument('--table', default='steam')
+    cmd.add_argument('--rejects', help="where to write malformed rows; default: PATH.rejects.csv")
+    cmd.add_argument('--changes', help="also write the changed appids to this JSON file")
+    cmd.set_defaults(func=refresh)
+
+    cmd = commands.add_parser('rollup-ratings', help=rollup.__doc__)
+    cmd.add_argument('--keep-days', type=int, default=7, help="days rolled up event partitions are kept")
+    cmd.set_defaults(func=rollup)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+-- Indexes backing keyset pagination. Each listing sort orders by its column
+-- and breaks ties on appid in the same direction, so a composite
+-- (column, appid) index serves both the ascending and (scanned backwards) the
+-- descending listings. appid itself is covered by the primary key. The
+-- rating listing's index comes with its review_score column in 002.
+
+CREATE INDEX IF NOT EXISTS steam_release_date_appid_idx ON steam (release_date, appid);
+
+CREATE INDEX IF NOT EXISTS steam_price_appid_idx ON steam (price, appid);
+
+CREATE INDEX IF NOT EXISTS steam_owners_appid_idx ON steam (owners, appid);
+
+CREATE INDEX IF NOT EXISTS steam_name_appid_idx ON steam (name, appid);
@@ -0,0 +1,15 @@
+-- Persist the review percentage instead of recomputing it per row on every
+-- query. As a generated column it stays current through every UPDATE of the
+-- rating counts, including the ones issued by update_rating(). Games without
+-- any ratings get NULL rather than a division by zero.
+
+ALTER TABLE steam ADD COLUMN IF NOT EXISTS review_score numeric(5, 2)
+    GENERATED ALWAYS AS (
+        CASE WHEN positive_ratings + negative_ratings > 0
+             THEN ROUND(positive_ratings * 100.0 / (positive_ratings + negative_ratings), 2)
+        END
+    ) STORED;
+
+-- Backs the 'By Rating' listing; must match queries.RATING_SORT. Unrated
+-- games sort after every rated one.
+CREATE INDEX IF NOT EXISTS steam_review_score_appid_idx ON steam ((COALESCE(review_score, -1)), appid);
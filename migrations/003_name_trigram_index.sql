@@ -0,0 +1,9 @@
+-- Trigram index so that name ILIKE '%term%' (search, modify and the searched
+-- Quick Actions) becomes a bitmap index scan instead of a sequential scan.
+-- Patterns need at least one 3-character run to be selective.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS steam_name_trgm_idx ON steam USING gin (name gin_trgm_ops);
+
+ANALYZE steam;
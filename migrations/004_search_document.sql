@@ -0,0 +1,32 @@
+-- Weighted full-text document over the descriptive text columns, for the
+-- 'Full text' search mode. Multi-valued columns are ';'-separated in the
+-- dataset, so separators are turned into spaces before parsing.
+--
+-- A trigger keeps the document current. It only fires when one of its
+-- source columns changes, so rating updates don't pay for re-parsing.
+
+ALTER TABLE steam ADD COLUMN IF NOT EXISTS search_document tsvector;
+
+CREATE OR REPLACE FUNCTION steam_search_document_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_document :=
+        setweight(to_tsvector('english', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('english', replace(coalesce(NEW.developer, ''), ';', ' ')), 'B') ||
+        setweight(to_tsvector('english', replace(coalesce(NEW.publisher, ''), ';', ' ')), 'B') ||
+        setweight(to_tsvector('english', replace(coalesce(NEW.genres, ''), ';', ' ')), 'C') ||
+        setweight(to_tsvector('english', replace(coalesce(NEW.steamspy_tags, ''), ';', ' ')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS steam_search_document_trigger ON steam;
+CREATE TRIGGER steam_search_document_trigger
+    BEFORE INSERT OR UPDATE OF name, developer, publisher, genres, steamspy_tags ON steam
+    FOR EACH ROW EXECUTE FUNCTION steam_search_document_update();
+
+-- Backfill existing rows through the trigger
+UPDATE steam SET name = name;
+
+CREATE INDEX IF NOT EXISTS steam_search_document_idx ON steam USING gin (search_document);
+
+ANALYZE steam;
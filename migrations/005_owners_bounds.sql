@@ -0,0 +1,25 @@
+-- owners holds an estimate bucket such as '10000000-20000000', which sorts as
+-- text ('5000-10000' after '10000000-20000000'). Parse the bounds into
+-- integer columns once, on every INSERT or UPDATE of owners, so 'By Player
+-- Count' and owner-range filters compare numbers and can use an index.
+-- Unparseable values get 0 so keyset positions never contain NULL.
+
+ALTER TABLE steam ADD COLUMN IF NOT EXISTS owners_low bigint
+    GENERATED ALWAYS AS (
+        COALESCE(NULLIF(regexp_replace(split_part(owners, '-', 1), '[^0-9]', '', 'g'), '')::bigint, 0)
+    ) STORED;
+
+ALTER TABLE steam ADD COLUMN IF NOT EXISTS owners_high bigint
+    GENERATED ALWAYS AS (
+        COALESCE(NULLIF(regexp_replace(split_part(owners, '-', 2), '[^0-9]', '', 'g'), '')::bigint,
+                 NULLIF(regexp_replace(split_part(owners, '-', 1), '[^0-9]', '', 'g'), '')::bigint,
+                 0)
+    ) STORED;
+
+-- Buckets don't overlap, so ordering by the lower bound orders by the range.
+-- Backs the 'By Player Count' listing; replaces the index on the text column.
+CREATE INDEX IF NOT EXISTS steam_owners_low_appid_idx ON steam (owners_low, appid);
+
+DROP INDEX IF EXISTS steam_owners_appid_idx;
+
+ANALYZE steam;
@@ -0,0 +1,10 @@
+-- Staging table for bulk vote ingestion (ratings.ingest_votes). Rows are
+-- COPY'd in, applied to steam with one set-based UPDATE and deleted again in
+-- the same transaction, so nothing here needs to survive a crash and WAL for
+-- it would be wasted work.
+
+CREATE UNLOGGED TABLE IF NOT EXISTS vote_staging (
+    appid integer NOT NULL,
+    positive_delta integer NOT NULL DEFAULT 0,
+    negative_delta integer NOT NULL DEFAULT 0
+);
@@ -0,0 +1,13 @@
+-- Sharded rating counters for RATING_MODE=sharded. A vote is added to one of
+-- N counter rows of its game instead of to the game's steam row, so a burst
+-- of votes for one game no longer queues on a single row lock. Reads add the
+-- shards to the steam counts, and ratings.rollup_shards() periodically folds
+-- them into steam and deletes them.
+
+CREATE TABLE IF NOT EXISTS rating_shards (
+    appid integer NOT NULL,
+    shard smallint NOT NULL,
+    positive integer NOT NULL DEFAULT 0,
+    negative integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (appid, shard)
+);
@@ -0,0 +1,32 @@
+-- Append-only rating event log for RATING_MODE=events. Every vote is an
+-- INSERT, so rating clicks no longer leave dead steam tuples behind for
+-- listing scans to skip. ratings.rollup_events() folds events past the
+-- watermark in rating_event_rollup into steam in one set-based UPDATE, and
+-- reads add the not yet rolled up tail to the steam counts.
+--
+-- The log is range partitioned by day; ratings.maintain_event_partitions()
+-- creates the coming days' partitions and drops rolled up ones with a plain
+-- DROP TABLE. The default partition only catches events cast while that
+-- job is not running; its next run moves them into their day's partition.
+
+CREATE TABLE IF NOT EXISTS rating_events (
+    id bigint GENERATED ALWAYS AS IDENTITY,
+    appid integer NOT NULL,
+    positive smallint NOT NULL DEFAULT 0,
+    negative smallint NOT NULL DEFAULT 0,
+    cast_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (id, cast_at)
+) PARTITION BY RANGE (cast_at);
+
+-- Backs the per-game tail read
+CREATE INDEX IF NOT EXISTS rating_events_appid_id_idx ON rating_events (appid, id);
+
+CREATE TABLE IF NOT EXISTS rating_events_default PARTITION OF rating_events DEFAULT;
+
+-- Highest event id already folded into steam; a single row
+CREATE TABLE IF NOT EXISTS rating_event_rollup (
+    singleton boolean PRIMARY KEY DEFAULT true CHECK (singleton),
+    last_event_id bigint NOT NULL DEFAULT 0
+);
+
+INSERT INTO rating_event_rollup DEFAULT VALUES ON CONFLICT DO NOTHING;
@@ -0,0 +1,19 @@
+-- Support links per game, loaded from steam_support_info.csv by
+-- 'python manage.py load-support' (loaders.load_support). Rows are COPY'd
+-- into the unlogged support_staging table and upserted on appid from there;
+-- line keeps the last of several rows for one appid.
+
+CREATE TABLE IF NOT EXISTS steam_support (
+    appid integer PRIMARY KEY,
+    website text,
+    support_url text,
+    support_email text
+);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS support_staging (
+    line bigint NOT NULL,
+    appid integer NOT NULL,
+    website text,
+    support_url text,
+    support_email text
+);
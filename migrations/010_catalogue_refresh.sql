@@ -0,0 +1,19 @@
+-- Incremental catalogue refreshes ('python manage.py refresh-steam',
+-- loaders.refresh_steam). steam_hashes holds a hash of each game's row as it
+-- last arrived in a dump, so a new dump only rewrites the games whose rows
+-- hash differently. Every refresh records the appids it inserted, updated
+-- and deleted in catalogue_refreshes, where app workers pick them up to
+-- invalidate just those games.
+
+CREATE TABLE IF NOT EXISTS steam_hashes (
+    appid integer PRIMARY KEY,
+    hash bytea NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS catalogue_refreshes (
+    id bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    refreshed_at timestamptz NOT NULL DEFAULT now(),
+    inserted integer[] NOT NULL,
+    updated integer[] NOT NULL,
+    deleted integer[] NOT NULL
+);
@@ -0,0 +1,6 @@
+-- Full reloads of the steam table ('python manage.py load-steam',
+-- loaders.load_steam) replace every game at once, so instead of listing
+-- appids they publish a catalogue_refreshes row with reloaded set, on which
+-- app workers drop everything they derived from the old table.
+
+ALTER TABLE catalogue_refreshes ADD COLUMN IF NOT EXISTS reloaded boolean NOT NULL DEFAULT false;
@@ -0,0 +1,115 @@
+"""Keyset (seek) pagination over the listing sorts defined in queries.SORTS.
+
+A page is fetched by seeking past the (sort value, appid) of the last row the
+client saw rather than with OFFSET, so page 500 costs the same index range
+scan as page 1. Positions are handed to clients as opaque cursor strings.
+"""
+import base64
+import json
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class Page:
+    """One page of listing rows plus cursors to its neighbours"""
+
+    def __init__(self, rows, next_cursor=None, prev_cursor=None):
+        self.rows = rows
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __bool__(self):
+        return bool(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+def encode_cursor(sort, row):
+    """Opaque cursor for the keyset position of ``row`` (sort_value and appid are its last columns)"""
+    # Dates and decimals go out as strings; the server casts them back to the
+    # column type when binding the prepared statement's parameters.
+    payload = json.dumps([sort, row[-2], row[-1]], default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(sort, cursor):
+    """(sort_value, appid) from a cursor, or ValueError if it is malformed or for another sort"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, sort_value, appid = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError) as e:
+        raise ValueError("invalid page cursor") from e
+    if cursor_sort != sort or not isinstance(appid, int) or isinstance(appid, bool):
+        raise ValueError("page cursor does not belong to this listing")
+    # Sort values are written as numbers, strings or null, never as lists or objects
+    if isinstance(sort_value, bool) or not isinstance(sort_value, (int, float, str, type(None))):
+        raise ValueError("invalid page cursor")
+    return sort_value, appid
+
+
+def parse_page_size(value):
+    """Clamp a requested page size to 1..MAX_PAGE_SIZE, defaulting to PAGE_SIZE"""
+    try:
+        return max(1, min(int(value), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return PAGE_SIZE
+
+
+def _seek_statement(prefix, direction, params):
+    """Name of the statement seeking ``direction`` from the position in ``params``.
+
+    A NULL sort value has statements of its own (see queries._page_statements),
+    which don't take it as a parameter.
+    """
+    if params['sort_value'] is None:
+        del params['sort_value']
+        return f"{prefix}_{direction}_null"
+    return f"{prefix}_{direction}"
+
+
+def fetch_page(statements, conn, sort, after=None, before=None, page_size=PAGE_SIZE, pattern=None,
+               filters=None):
+    """Fetch one page of ``sort`` starting after/before the given cursor.
+
+    With a ``pattern`` the listing is restricted to names matching it;
+    ``filters`` supplies the parameters of the sort's queries.SORT_FILTERS
+    condition, if it has one. One extra row is requested to find out whether
+    another page follows.
+    """
+    prefix = f"search_page_{sort}" if pattern is not None else f"page_{sort}"
+    params = {'limit': page_size + 1, **(filters or {})}
+    if pattern is not None:
+        params['pattern'] = pattern
+
+    if after:
+        params['sort_value'], params['appid'] = decode_cursor(sort, after)
+        rows = list(statements.run(conn, _seek_statement(prefix, 'after', params), **params))
+        has_next, has_prev = len(rows) > page_size, True
+        rows = rows[:page_size]
+    elif before:
+        params['sort_value'], params['appid'] = decode_cursor(sort, before)
+        rows = list(statements.run(conn, _seek_statement(prefix, 'before', params), **params))
+        has_next, has_prev = True, len(rows) > page_size
+        rows = rows[:page_size][::-1]
+    else:
+        rows = list(statements.run(conn, f"{prefix}_first", **params))
+        has_next, has_prev = len(rows) > page_size, False
+        rows = rows[:page_size]
+
+    return make_page(sort, rows, has_next, has_prev)
+
+
+def make_page(sort, rows, has_next, has_prev):
+    """Page of ``rows`` with cursors past its first and last row where neighbours exist"""
+    if not rows:
+        return Page(rows)
+    return Page(
+        rows,
+        next_cursor=encode_cursor(sort, rows[-1]) if has_next else None,
+        prev_cursor=encode_cursor(sort, rows[0]) if has_prev else None,
+    )
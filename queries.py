@@ -0,0 +1,337 @@
+"""Fixed SQL used by the routes in app.py.
+
+Statements use pg8000's named parameter style (``:name``) so they can be
+prepared once per connection through :class:`db.StatementCache`.
+"""
+
+# Stored generated column (migrations/002_review_score.sql); NULL for unrated games
+REVIEWS = "review_score"
+
+# Sort expression for 'By Rating': keeps keyset positions non-NULL and puts
+# unrated games last. Backed by steam_review_score_appid_idx.
+RATING_SORT = "COALESCE(review_score, -1)"
+
+GAME_COLUMNS = f"name, release_date, price, {REVIEWS} AS reviews"
+
+# Sort key -> (sort column, direction). Every listing breaks ties on appid in
+# the same direction, which makes (column, appid) a unique keyset position.
+SORTS = {
+    'appid': ("appid", "ASC"),
+    'newest': ("release_date", "DESC"),
+    'rating': (RATING_SORT, "DESC"),
+    'price': ("price", "ASC"),
+    'player_count': ("owners_low", "DESC"),
+    'name': ("name", "ASC"),
+}
+
+# Sorts whose column can be NULL; the others are keys or COALESCE'd
+NULLABLE_SORTS = {'newest', 'price', 'name'}
+
+# Extra condition applied to a sort's listings. 'By Player Count' takes an
+# owner range; buckets don't overlap, so its lower end bounds the sort column
+# itself and narrows the same index range scan.
+SORT_FILTERS = {
+    'player_count': "owners_low >= :min_owners AND owners_high <= :max_owners",
+}
+
+# Owner range of listings that aren't filtered
+ANY_OWNERS = (0, 2 ** 62)
+
+
+def owner_range(value):
+    """SORT_FILTERS parameters for a 'low-high' owner range such as '20000-50000'.
+
+    Either end may be left empty; a blank or malformed value means any range.
+    """
+    low, high = ANY_OWNERS
+    try:
+        first, _, last = (value or '').partition('-')
+        low = int(first) if first.strip() else low
+        high = int(last) if last.strip() else high
+    except ValueError:
+        low, high = ANY_OWNERS
+    return {'min_owners': low, 'max_owners': high}
+
+
+# Quick Action -> sort key
+SORT_ACTIONS = {
+    'By Newest': 'newest',
+    'By Rating': 'rating',
+    'By Price': 'price',
+    'By Player Count': 'player_count',
+    'By Name': 'name',
+}
+
+# update_rating() form field -> rating column change
+RATING_CHANGES = {
+    'positive_add': "positive_ratings = positive_ratings + 1",
+    'positive_remove': "positive_ratings = positive_ratings - 1",
+    'negative_add': "negative_ratings = negative_ratings + 1",
+    'negative_remove': "negative_ratings = negative_ratings - 1",
+}
+
+# The same changes as (positive, negative) deltas, for batched and sharded writes
+RATING_DELTAS = {
+    'positive_add': (1, 0),
+    'positive_remove': (-1, 0),
+    'negative_add': (0, 1),
+    'negative_remove': (0, -1),
+}
+
+
+def review_of(positive, negative):
+    """SQL for the review percentage of two count expressions, as migrations/002 stores it"""
+    return (f"CASE WHEN {positive} + {negative} > 0 "
+            f"THEN ROUND({positive} * 100.0 / ({positive} + {negative}), 2) END")
+
+
+# RATING_MODE -> votes of the games in :appids that are not yet rolled up
+# into steam: counter shards (migrations/007_rating_shards.sql) or the tail
+# of the event log (migrations/008_rating_events.sql)
+PENDING_VOTES = {
+    'sharded': "SELECT appid, positive, negative FROM rating_shards WHERE appid = ANY(:appids)",
+    'events': """
+        SELECT appid, positive, negative FROM rating_events
+        WHERE appid = ANY(:appids) AND id > (SELECT last_event_id FROM rating_event_rollup)
+    """,
+}
+
+
+def live_counts(pending):
+    """SQL for the rating counts of the games in :appids with ``pending`` votes added"""
+    return f"""
+        SELECT steam.appid, steam.name,
+               steam.positive_ratings + COALESCE(SUM(pending.positive), 0) AS positive,
+               steam.negative_ratings + COALESCE(SUM(pending.negative), 0) AS negative
+        FROM steam LEFT JOIN ({pending}) AS pending USING (appid)
+        WHERE steam.appid = ANY(:appids)
+        GROUP BY steam.appid
+    """
+
+
+def like_pattern(term):
+    """ILIKE pattern matching ``term`` anywhere in a name.
+
+    LIKE wildcards typed by the user are escaped so they match literally; this
+    also keeps a lone '%' or '_' from turning into a match-everything scan
+    that no index can help with.
+    """
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+def _where(*conditions):
+    conditions = [c for c in conditions if c]
+    return f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+def _page_statements(prefix, search, column, direction, sort_filter=None, nullable=False):
+    """Keyset pagination statements for one sort, with optional name and sort filters.
+
+    ``first`` starts at the top, ``after`` continues past a (sort_value, appid)
+    position and ``before`` walks backwards from one; its rows come back in
+    reverse order. All of them take a :limit.
+
+    A row comparison with NULL is never true, so a ``nullable`` column also
+    gets ``after_null`` and ``before_null`` statements for positions whose
+    sort value is NULL, and its other statements take in the NULL rows that
+    lie beyond a non-NULL position. NULLs sort last ascending and first
+    descending, Postgres' default and catalogue.position_key()'s order.
+    """
+    reverse = "DESC" if direction == "ASC" else "ASC"
+    forward_cmp, backward_cmp = (">", "<") if direction == "ASC" else ("<", ">")
+    select = f"SELECT {GAME_COLUMNS}, {column} AS sort_value, appid FROM steam"
+    name_filter = "name ILIKE :pattern" if search else None
+    position = f"({column}, appid) {{}} (:sort_value, :appid)"
+    forward, backward = position.format(forward_cmp), position.format(backward_cmp)
+    statements = {}
+    if nullable:
+        # The NULL rows come after every value ascending and before every value descending
+        if direction == "ASC":
+            forward = f"({forward} OR {column} IS NULL)"
+        else:
+            backward = f"({backward} OR {column} IS NULL)"
+        null_forward, null_backward = (
+            (f"{column} IS NULL AND appid > :appid", f"({column} IS NOT NULL OR appid < :appid)")
+            if direction == "ASC" else
+            (f"({column} IS NOT NULL OR appid < :appid)", f"{column} IS NULL AND appid > :appid")
+        )
+        statements[f'{prefix}_after_null'] = (f"{select} {_where(name_filter, sort_filter, null_forward)} "
+                                              f"ORDER BY {column} {direction}, appid {direction} LIMIT :limit")
+        statements[f'{prefix}_before_null'] = (f"{select} {_where(name_filter, sort_filter, null_backward)} "
+                                               f"ORDER BY {column} {reverse}, appid {reverse} LIMIT :limit")
+    statements.update({
+        f'{prefix}_first':
+            f"{select} {_where(name_filter, sort_filter)} ORDER BY {column} {direction}, appid {direction} LIMIT :limit",
+        f'{prefix}_after':
+            f"{select} {_where(name_filter, sort_filter, forward)} "
+            f"ORDER BY {column} {direction}, appid {direction} LIMIT :limit",
+        f'{prefix}_before':
+            f"{select} {_where(name_filter, sort_filter, backward)} "
+            f"ORDER BY {column} {reverse}, appid {reverse} LIMIT :limit",
+    })
+    return statements
+
+
+def _statements():
+    statements = {
+        # search() and modify() find matching appids in search_index.NameIndex first
+        'search': f"SELECT {GAME_COLUMNS}, appid FROM steam WHERE appid = ANY(:appids) ORDER BY appid",
+        # Ranked search over the weighted tsvector from migrations/004_search_document.sql
+        'search_fulltext': f"""
+            SELECT {GAME_COLUMNS}, appid
+            FROM steam, websearch_to_tsquery('english', :query) AS query
+            WHERE search_document @@ query
+            ORDER BY ts_rank(search_document, query) DESC, appid
+            LIMIT :limit
+        """,
+        'count_all': "SELECT COUNT(*) FROM steam",
+        'count_search': "SELECT COUNT(*) FROM steam WHERE name ILIKE :pattern",
+        'modify': f"""
+            SELECT name, positive_ratings, negative_ratings, {REVIEWS} AS reviews, appid
+            FROM steam
+            WHERE appid = ANY(:appids)
+            ORDER BY appid
+        """,
+        # Everything about one game for its detail page, support links from
+        # migrations/009_steam_support.sql included
+        'game_detail': """
+            SELECT steam.*, support.website, support.support_url, support.support_email
+            FROM steam LEFT JOIN steam_support AS support USING (appid)
+            WHERE steam.appid = :appid
+        """,
+        # Changed appids published by loaders.refresh_steam() and full reloads by loaders.load_steam()
+        # (migrations/010_catalogue_refresh.sql, 011_catalogue_reloads.sql)
+        'latest_catalogue_refresh': "SELECT COALESCE(MAX(id), 0) FROM catalogue_refreshes",
+        'catalogue_refreshes_since': (
+            "SELECT id, inserted, updated, deleted, reloaded FROM catalogue_refreshes WHERE id > :after ORDER BY id"
+        ),
+        'name_index': "SELECT appid, name, owners_low, positive_ratings + negative_ratings FROM steam",
+        # Columns of catalogue.Catalogue snapshot rows
+        'catalogue': (
+            "SELECT appid, name, release_date, price, review_score, owners_low, owners_high,"
+            " platforms, genres, categories, required_age FROM steam"
+        ),
+    }
+    for key, (column, direction) in SORTS.items():
+        order = f"ORDER BY {column} {direction}, appid {direction}"
+        sort_filter = SORT_FILTERS.get(key)
+        statements[f'list_{key}'] = f"SELECT {GAME_COLUMNS}, appid FROM steam {_where(sort_filter)} {order}"
+        statements[f'search_{key}'] = (f"SELECT {GAME_COLUMNS}, appid FROM steam "
+                                       f"{_where('name ILIKE :pattern', sort_filter)} {order}")
+        nullable = key in NULLABLE_SORTS
+        statements.update(_page_statements(f'page_{key}', False, column, direction, sort_filter, nullable))
+        statements.update(_page_statements(f'search_page_{key}', True, column, direction, sort_filter, nullable))
+    # Applies a batch of per-game deltas (ratings.RatingBatcher) in one statement
+    statements['rating_batch'] = f"""
+        UPDATE steam
+        SET positive_ratings = positive_ratings + delta.positive,
+            negative_ratings = negative_ratings + delta.negative
+        FROM unnest(:appids::int[], :positive::int[], :negative::int[]) AS delta(appid, positive, negative)
+        WHERE steam.appid = delta.appid
+        RETURNING steam.appid, steam.{REVIEWS}
+    """
+    # Bulk votes COPY'd into vote_staging (migrations/006_vote_staging.sql) by ratings.ingest_votes()
+    statements['staged_vote_games'] = "SELECT COUNT(DISTINCT appid) FROM vote_staging"
+    statements['rating_staged'] = f"""
+        UPDATE steam
+        SET positive_ratings = positive_ratings + delta.positive,
+            negative_ratings = negative_ratings + delta.negative
+        FROM (
+            SELECT appid, SUM(positive_delta) AS positive, SUM(negative_delta) AS negative
+            FROM vote_staging
+            GROUP BY appid
+        ) AS delta
+        WHERE steam.appid = delta.appid
+        RETURNING steam.appid, steam.{REVIEWS}
+    """
+    statements['clear_vote_staging'] = "DELETE FROM vote_staging"
+    # steam_support_info.csv rows COPY'd into support_staging (migrations/009_steam_support.sql)
+    # by loaders.load_support(); the last row per appid wins and unchanged rows aren't rewritten
+    statements['support_upsert'] = """
+        WITH upserted AS (
+            INSERT INTO steam_support AS support (appid, website, support_url, support_email)
+            SELECT DISTINCT ON (appid) appid, website, support_url, support_email
+            FROM support_staging
+            ORDER BY appid, line DESC
+            ON CONFLICT (appid) DO UPDATE
+            SET website = EXCLUDED.website,
+                support_url = EXCLUDED.support_url,
+                support_email = EXCLUDED.support_email
+            WHERE (support.website, support.support_url, support.support_email)
+                  IS DISTINCT FROM (EXCLUDED.website, EXCLUDED.support_url, EXCLUDED.support_email)
+            RETURNING 1
+        )
+        SELECT COUNT(*) FROM upserted
+    """
+    statements['clear_support_staging'] = "DELETE FROM support_staging"
+    # RATING_MODE=sharded: a vote lands on one counter row of its game; reads add
+    # the shards in, and the rollup folds them into steam in one statement
+    statements['rating_shard_add'] = """
+        INSERT INTO rating_shards AS counter (appid, shard, positive, negative)
+        SELECT appid, :shard::smallint, :positive::int, :negative::int FROM steam WHERE appid = :appid::int
+        ON CONFLICT (appid, shard) DO UPDATE
+        SET positive = counter.positive + EXCLUDED.positive,
+            negative = counter.negative + EXCLUDED.negative
+        RETURNING appid
+    """
+    statements['rollup_shards'] = f"""
+        WITH folded AS (
+            DELETE FROM rating_shards RETURNING appid, positive, negative
+        )
+        UPDATE steam
+        SET positive_ratings = positive_ratings + delta.positive,
+            negative_ratings = negative_ratings + delta.negative
+        FROM (
+            SELECT appid, SUM(positive) AS positive, SUM(negative) AS negative
+            FROM folded
+            GROUP BY appid
+        ) AS delta
+        WHERE steam.appid = delta.appid
+        RETURNING steam.appid, steam.{REVIEWS}
+    """
+    # RATING_MODE=events: a vote is one appended event; the rollup folds the
+    # events in (:after, :upto] into steam and moves the watermark past them
+    statements['rating_event_add'] = """
+        INSERT INTO rating_events (appid, positive, negative)
+        SELECT appid, :positive::smallint, :negative::smallint FROM steam WHERE appid = :appid::int
+        RETURNING appid
+    """
+    statements['event_rollup_range'] = (
+        "SELECT last_event_id, (SELECT COALESCE(MAX(id), 0) FROM rating_events) FROM rating_event_rollup"
+    )
+    statements['advance_event_rollup'] = """
+        UPDATE rating_event_rollup SET last_event_id = :upto::bigint
+        WHERE last_event_id = :after::bigint
+        RETURNING last_event_id
+    """
+    statements['rollup_events'] = f"""
+        UPDATE steam
+        SET positive_ratings = positive_ratings + delta.positive,
+            negative_ratings = negative_ratings + delta.negative
+        FROM (
+            SELECT appid, SUM(positive) AS positive, SUM(negative) AS negative
+            FROM rating_events
+            WHERE id > :after::bigint AND id <= :upto::bigint
+            GROUP BY appid
+        ) AS delta
+        WHERE steam.appid = delta.appid
+        RETURNING steam.appid, steam.{REVIEWS}
+    """
+    # Live counts for the modes that defer votes: the modify page's rows, and
+    # one game's row as update_rating() returns it
+    reviews = review_of('positive', 'negative')
+    for mode, pending in PENDING_VOTES.items():
+        live = live_counts(pending)
+        statements[f'modify_{mode}'] = (f"SELECT name, positive, negative, {reviews} AS reviews, appid "
+                                        f"FROM ({live}) AS live ORDER BY appid")
+        statements[f'rating_live_{mode}'] = (f"SELECT appid, name, positive, negative, {reviews} AS reviews "
+                                             f"FROM ({live}) AS live ORDER BY appid")
+    # One game by primary key; returns what the modify page shows for it
+    for field, change in RATING_CHANGES.items():
+        statements[f'rating_{field}'] = (f"UPDATE steam SET {change} WHERE appid = :appid "
+                                         f"RETURNING appid, name, positive_ratings, negative_ratings, {REVIEWS}")
+    return statements
+
+
+STATEMENTS = _statements()
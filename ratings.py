@@ -0,0 +1,557 @@
+"""Write-behind batching and bulk ingestion of rating votes.
+
+update_rating() normally runs one UPDATE and one commit per click, so votes
+per second are capped by commit latency. A :class:`RatingBatcher` instead
+adds each vote to an in-memory delta per game and a background thread
+applies all pending deltas in one statement and one commit.
+:func:`cast_sharded_vote` spreads the votes of a hot game over several
+counter rows, which :func:`rollup_shards` folds back in periodically.
+:func:`cast_logged_vote` appends votes to an event log instead, which
+:func:`rollup_events` folds in.
+:func:`ingest_votes` loads votes replayed from elsewhere in bulk.
+"""
+import csv
+import datetime
+import fcntl
+import json
+import os
+import pathlib
+import random
+import threading
+import time
+import uuid
+
+from loaders import CopyFeed
+
+
+class RatingBatcher:
+    """Accumulates rating deltas per game and applies them in batches.
+
+    ``apply(deltas)`` gets ``{appid: [positive, negative]}`` and must write it
+    in a single transaction; it runs on the batcher's thread. A batch is
+    applied ``interval`` seconds after its first vote, or as soon as it
+    holds ``max_events`` votes. If ``apply`` raises, the batch is merged back
+    and retried after ``retry_delay`` seconds.
+
+    With a ``log_dir``, every vote is appended to a log segment before
+    :meth:`add` returns (and fsync'd if ``fsync``), and the segment is
+    deleted once its batch is committed. Each process holds a lock on its
+    own segments; on start-up, segments whose owner has died are applied
+    first. A crash between a commit and the deletion of its segment
+    replays that batch, so delivery is at least once.
+    """
+
+    def __init__(self, apply, interval=0.005, max_events=500, log_dir=None, fsync=False, retry_delay=1.0):
+        self.apply = apply
+        self.interval = interval
+        self.max_events = max_events
+        self.fsync = fsync
+        self.retry_delay = retry_delay
+
+        self._pending = {}
+        self._events = 0
+        self._deadline = None
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self.votes = 0
+        self.batches = 0
+        self.rows = 0
+        self.failures = 0
+        self.flush_seconds = 0.0
+
+        self.log_dir = pathlib.Path(log_dir) if log_dir else None
+        self._segments = []     # log segments holding the pending votes
+        self._log = None
+        if self.log_dir is not None:
+            self.log_dir.mkdir(parents=True, exist_ok=True)
+            self._owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+            # Lock before the file becomes visible, so recover() in another
+            # process never mistakes a starting writer for a dead one
+            lock_path = self.log_dir / f"{self._owner}.lock"
+            self._lock_file = open(lock_path.with_suffix('.new'), 'w')
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            os.rename(lock_path.with_suffix('.new'), lock_path)
+            self._segment_ids = iter(range(1 << 62))
+            self.recover()
+            self._open_segment()
+
+        self._thread = threading.Thread(target=self._run, name="rating-batcher", daemon=True)
+        self._thread.start()
+
+    def _open_segment(self):
+        path = self.log_dir / f"{self._owner}-{next(self._segment_ids):012d}.log"
+        self._log = open(path, 'a', encoding='utf-8')
+        self._segments.append(path)
+
+    @staticmethod
+    def read_segment(path, deltas):
+        """Add the votes logged in ``path`` to ``deltas``; a torn last line is skipped"""
+        with open(path, encoding='utf-8') as log:
+            for line in log:
+                try:
+                    appid, positive, negative = json.loads(line)
+                except ValueError:
+                    continue
+                delta = deltas.setdefault(appid, [0, 0])
+                delta[0] += positive
+                delta[1] += negative
+        return deltas
+
+    def recover(self):
+        """Apply the logged votes of processes that died before committing them.
+
+        Segments that fail to apply are left for the next start-up.
+        """
+        for lock_path in sorted(self.log_dir.glob("*.lock")):
+            owner = lock_path.stem
+            if owner == self._owner:
+                continue
+            with open(lock_path, 'a') as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue    # its process is still running
+                segments = sorted(self.log_dir.glob(f"{owner}-*.log"))
+                deltas = {}
+                for path in segments:
+                    self.read_segment(path, deltas)
+                try:
+                    if deltas:
+                        self.apply(deltas)
+                except Exception:
+                    self.failures += 1
+                    continue
+                for path in segments:
+                    path.unlink()
+                lock_path.unlink()
+
+    def add(self, appid, positive, negative):
+        """Queue a vote for one game; it is applied with the next batch"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("rating batcher is closed")
+            if self._log is not None:
+                self._log.write(json.dumps([appid, positive, negative]) + "\n")
+                self._log.flush()
+                if self.fsync:
+                    os.fsync(self._log.fileno())
+            delta = self._pending.setdefault(appid, [0, 0])
+            delta[0] += positive
+            delta[1] += negative
+            self._events += 1
+            self.votes += 1
+            if self._deadline is None:
+                # Wake the flusher so it starts timing this batch
+                self._deadline = time.monotonic() + self.interval
+                self._cond.notify()
+            elif self._events >= self.max_events:
+                self._cond.notify()
+
+    def _take_batch(self):
+        """Swap out the pending deltas and start a new log segment for later votes"""
+        batch, self._pending = self._pending, {}
+        self._events = 0
+        self._deadline = None
+        segments = []
+        if self._log is not None:
+            self._log.close()
+            segments, self._segments = self._segments, []
+            self._open_segment()
+        return batch, segments
+
+    def _restore_batch(self, batch, segments):
+        for appid, (positive, negative) in batch.items():
+            delta = self._pending.setdefault(appid, [0, 0])
+            delta[0] += positive
+            delta[1] += negative
+        self._segments[:0] = segments
+        if self._deadline is None:
+            self._deadline = time.monotonic() + self.retry_delay
+
+    def _flush(self, batch, segments):
+        start = time.perf_counter()
+        try:
+            self.rows += self.apply(batch) or 0
+        except Exception:
+            self.failures += 1
+            with self._cond:
+                self._restore_batch(batch, segments)
+            return False
+        for path in segments:
+            path.unlink()
+        self.batches += 1
+        self.flush_seconds += time.perf_counter() - start
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and not (
+                        self._pending and (self._events >= self.max_events
+                                           or time.monotonic() >= self._deadline)):
+                    timeout = None if self._deadline is None else max(0.0, self._deadline - time.monotonic())
+                    self._cond.wait(timeout)
+                if self._closed:
+                    return
+                batch, segments = self._take_batch()
+            if not self._flush(batch, segments):
+                time.sleep(self.retry_delay)
+
+    def flush(self):
+        """Apply everything pending now, on the calling thread"""
+        with self._cond:
+            if not self._pending:
+                return True
+            batch, segments = self._take_batch()
+        return self._flush(batch, segments)
+
+    def close(self):
+        """Stop the background thread and apply what is still pending"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self.flush()
+        if self._log is not None:
+            self._log.close()
+            for path in self._segments:
+                if path.stat().st_size == 0:
+                    path.unlink()
+            self._segments = [path for path in self._segments if path.exists()]
+            if not self._segments:
+                (self.log_dir / f"{self._owner}.lock").unlink()
+            self._lock_file.close()
+
+    def stats(self):
+        with self._cond:
+            pending = self._events
+        return {
+            'votes': self.votes,
+            'pending': pending,
+            'batches': self.batches,
+            'rows': self.rows,
+            'failures': self.failures,
+            'avg_batch_votes': round((self.votes - pending) / self.batches, 1) if self.batches else 0.0,
+            'flush_avg_ms': round(self.flush_seconds / self.batches * 1000, 2) if self.batches else 0.0,
+        }
+
+
+def cast_sharded_vote(conn, statements, appid, positive, negative, shards):
+    """Add a vote to a random one of the game's ``shards`` counter rows.
+
+    Concurrent votes for the same game mostly land on different rows and
+    don't wait for each other's commits; the game's steam row isn't locked
+    at all. Returns the game's live (appid, name, positive, negative,
+    review_score) row, or no rows if there is no such game.
+    """
+    try:
+        added = statements.run(conn, 'rating_shard_add', appid=appid, shard=random.randrange(shards),
+                               positive=positive, negative=negative)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if not added:
+        return []
+    return statements.run(conn, 'rating_live_sharded', appids=[appid])
+
+
+def rollup_shards(conn, statements):
+    """Fold every counter shard into steam and delete it, in one transaction.
+
+    Returns the (appid, review_score) rows of the games that changed. Votes
+    cast while it runs wait for its commit and then start new shards.
+    """
+    try:
+        changed = statements.run(conn, 'rollup_shards')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return changed
+
+
+def cast_logged_vote(conn, statements, appid, positive, negative):
+    """Append a vote to the rating event log.
+
+    Nothing is updated, so votes leave no dead tuples in steam. Returns the
+    game's live (appid, name, positive, negative, review_score) row, or no
+    rows if there is no such game.
+    """
+    try:
+        added = statements.run(conn, 'rating_event_add', appid=appid, positive=positive, negative=negative)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if not added:
+        return []
+    return statements.run(conn, 'rating_live_events', appids=[appid])
+
+
+def rollup_events(conn, statements):
+    """Fold the events logged since the last rollup into steam.
+
+    Event ids are handed out before their transactions commit, so an id
+    below the newest one may still be invisible. A brief SHARE lock, which
+    waits for in-flight votes and holds off new ones, fixes the upper end of
+    the range; every event up to it is then final. The range is folded in
+    with one UPDATE, in the transaction that moves the watermark, so reads
+    never count an event twice or not at all. Concurrent rollups claim the
+    range through the watermark row; the loser changes nothing.
+
+    Returns the (appid, review_score) rows of the games that changed.
+    """
+    try:
+        conn.run("LOCK TABLE rating_events IN SHARE MODE")
+        (after, upto), = statements.run(conn, 'event_rollup_range')
+        conn.commit()
+        if upto <= after:
+            return []
+        if not statements.run(conn, 'advance_event_rollup', after=after, upto=upto):
+            conn.rollback()
+            return []
+        changed = statements.run(conn, 'rollup_events', after=after, upto=upto)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return changed
+
+
+def _event_partition(day):
+    return f"rating_events_p{day:%Y%m%d}"
+
+
+def _create_event_partition(conn, day):
+    """Create one day's partition, moving events already in the default partition into it.
+
+    Attaching a partition fails while the default one holds rows for its
+    range, so those rows are taken out and routed back in through the
+    parent, ids included, in the same transaction.
+    """
+    name = _event_partition(day)
+    (exists,), = conn.run("SELECT to_regclass(:name) IS NOT NULL", name=name)
+    if exists:
+        conn.rollback()
+        return
+    bounds = {'start': f"{day}T00:00Z", 'end': f"{day + datetime.timedelta(days=1)}T00:00Z"}
+    try:
+        # Holds off votes that would land in the default partition meanwhile
+        conn.run("LOCK TABLE rating_events_default IN EXCLUSIVE MODE")
+        conn.run("CREATE TEMP TABLE moved_events (LIKE rating_events) ON COMMIT DROP")
+        conn.run("""
+            WITH moved AS (
+                DELETE FROM rating_events_default
+                WHERE cast_at >= CAST(:start AS timestamptz) AND cast_at < CAST(:end AS timestamptz)
+                RETURNING *
+            )
+            INSERT INTO moved_events SELECT * FROM moved
+        """, **bounds)
+        conn.run(f"CREATE TABLE {name} PARTITION OF rating_events "
+                 f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')")
+        conn.run("INSERT INTO rating_events OVERRIDING SYSTEM VALUE SELECT * FROM moved_events")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def maintain_event_partitions(conn, keep_days=7, days_ahead=2, today=None):
+    """Create the coming days' event partitions and drop old rolled up ones.
+
+    Partitions cover one UTC day each. Days are created furthest first, each
+    in its own transaction, so one that fails doesn't keep the later ones
+    from existing; days whose events ended up in the default partition get
+    a partition too, which empties it again. A partition is dropped once it
+    ended more than ``keep_days`` days ago and all of its events are at or
+    below the rollup watermark; dropping is a catalog change, not a DELETE,
+    so it costs the same whatever the partition holds. Returns the names of
+    the dropped partitions; if a day could not be created, its error is
+    raised after the drops.
+    """
+    today = today or datetime.datetime.now(datetime.timezone.utc).date()
+    days = {today + datetime.timedelta(days=offset) for offset in range(days_ahead + 1)}
+    days.update(day for (day,) in conn.run(
+        "SELECT DISTINCT CAST(cast_at AT TIME ZONE 'UTC' AS date) FROM rating_events_default"))
+    conn.rollback()
+    failure = None
+    for day in sorted(days, reverse=True):
+        try:
+            _create_event_partition(conn, day)
+        except Exception as e:
+            failure = failure or e
+
+    try:
+        (watermark,), = conn.run("SELECT last_event_id FROM rating_event_rollup")
+        partitions = conn.run("""
+            SELECT child.relname FROM pg_inherits
+            JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = 'rating_events'::regclass
+        """)
+        oldest = _event_partition(today - datetime.timedelta(days=keep_days))
+        dropped = []
+        for (name,) in sorted(partitions):
+            if not name.startswith('rating_events_p') or name >= oldest:
+                continue
+            (newest,), = conn.run(f"SELECT MAX(id) FROM {name}")
+            if newest is None or newest <= watermark:
+                conn.run(f"DROP TABLE {name}")
+                dropped.append(name)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if failure is not None:
+        raise failure
+    return dropped
+
+
+class Periodic:
+    """Calls ``job()`` every ``interval`` seconds on a background thread.
+
+    ``job`` returns the number of rows it changed. A failing run is counted
+    and retried at the next interval. With ``immediately`` the first run
+    starts right away instead of one interval in.
+    """
+
+    def __init__(self, job, interval, name="periodic", immediately=False):
+        self.job = job
+        self.interval = interval
+        self.immediately = immediately
+        self._stop = threading.Event()
+
+        self.runs = 0
+        self.rows = 0
+        self.failures = 0
+        self.last_ms = 0.0
+
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def run_once(self):
+        """Run the job now, on the calling thread"""
+        start = time.perf_counter()
+        try:
+            self.rows += self.job() or 0
+        except Exception:
+            self.failures += 1
+            return False
+        self.runs += 1
+        self.last_ms = (time.perf_counter() - start) * 1000
+        return True
+
+    def _run(self):
+        if self.immediately:
+            self.run_once()
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def close(self):
+        """Stop the background thread and run the job one last time"""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join()
+        self.run_once()
+
+    def stats(self):
+        return {
+            'runs': self.runs,
+            'rows': self.rows,
+            'failures': self.failures,
+            'last_ms': round(self.last_ms, 2),
+        }
+
+
+VOTE_FIELDS = ('appid', 'positive_delta', 'negative_delta')
+
+
+def _json_vote_value(value):
+    """A vote field decoded from JSON; null counts as 0, anything but an integer is refused"""
+    if value is None:
+        return 0
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f"not an integer: {value!r}")
+    return value
+
+
+def parse_votes(lines, fmt):
+    """(appid, positive_delta, negative_delta) tuples from NDJSON or CSV lines.
+
+    NDJSON lines are objects with the VOTE_FIELDS keys or three-element
+    arrays of integers. CSV may start with a header naming the columns;
+    otherwise they are taken in VOTE_FIELDS order. Blank lines are skipped
+    and a malformed line, or a value that is not an integer, raises
+    ValueError with its line number.
+    """
+    if fmt == 'ndjson':
+        rows = lines
+    elif fmt == 'csv':
+        rows = csv.reader(lines)
+    else:
+        raise ValueError(f"unknown vote format: {fmt}")
+
+    columns = None
+    for number, row in enumerate(rows, 1):
+        try:
+            if fmt == 'ndjson':
+                if not row.strip():
+                    continue
+                row = json.loads(row)
+            if not row:
+                continue
+            if isinstance(row, dict):
+                row = [row.get(field, 0) for field in VOTE_FIELDS]
+            elif fmt == 'csv' and number == 1 and not row[0].strip().lstrip('-').isdigit():
+                columns = [VOTE_FIELDS.index(name.strip()) for name in row]
+                continue
+            if columns is not None:
+                ordered = [0, 0, 0]
+                for position, value in zip(columns, row):
+                    ordered[position] = value
+                row = ordered
+            if fmt == 'csv':
+                appid, positive, negative = (int(value or 0) for value in row)
+            else:
+                appid, positive, negative = (_json_vote_value(value) for value in row)
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"line {number}: {e}") from e
+        yield appid, positive, negative
+
+
+def ingest_votes(conn, lines, fmt, statements):
+    """Stream votes into the staging table with COPY and apply them with one UPDATE.
+
+    Everything happens in one transaction; staged rows are only ever
+    visible to it, so concurrent ingests don't see each other's votes.
+    Memory stays bounded by one COPY chunk whatever the input size. Returns
+    a report dict whose 'changed' holds the (appid, review_score) rows the
+    UPDATE returned.
+    """
+    start = time.perf_counter()
+    feed = CopyFeed(parse_votes(lines, fmt))
+    try:
+        conn.run("COPY vote_staging (appid, positive_delta, negative_delta) FROM STDIN WITH (FORMAT csv)",
+                 stream=feed)
+        if feed.error is not None:
+            raise feed.error
+        (games,), = statements.run(conn, 'staged_vote_games')
+        changed = statements.run(conn, 'rating_staged')
+        statements.run(conn, 'clear_vote_staging')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    seconds = time.perf_counter() - start
+    return {
+        'rows': feed.count,
+        'games': len(changed),
+        'unknown_games': games - len(changed),
+        'seconds': round(seconds, 3),
+        'rows_per_s': round(feed.count / seconds) if seconds else 0,
+        'changed': changed,
+    }
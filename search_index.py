@@ -0,0 +1,236 @@
+"""In-memory indexes over game names, built from one bulk read of steam.
+
+Names only change when the catalogue is reloaded (update_rating() touches
+ratings, never names), so the indexes are built once per worker and answer
+name lookups without a database round trip.
+"""
+import heapq
+import math
+import re
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+
+def normalize(text):
+    """Case-fold the way ILIKE does for the purposes of matching"""
+    return text.lower()
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+_WORD = re.compile(r"\w+")
+
+
+def word_trigrams(text):
+    """pg_trgm-style trigrams: per alphanumeric word, padded with two leading
+    blanks and one trailing blank, so punctuation and spacing don't matter"""
+    grams = set()
+    for word in _WORD.findall(text):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _contains(posting, value):
+    i = bisect_left(posting, value)
+    return i < len(posting) and posting[i] == value
+
+
+def _hits(candidates, posting):
+    """Members of the ``candidates`` set that also appear in a sorted posting"""
+    if len(posting) > 8 * len(candidates):
+        # Binary search per candidate beats walking a long posting
+        return [p for p in candidates if _contains(posting, p)]
+    return candidates.intersection(posting)
+
+
+def _add_postings(postings, grams, position):
+    for gram in grams:
+        posting = postings.get(gram)
+        if posting is None:
+            posting = postings[gram] = array('i')
+        posting.append(position)    # positions arrive in order, so postings stay sorted
+
+
+class NameIndex:
+    """Trigram inverted index answering case-insensitive substring matches.
+
+    Every name is split into its overlapping 3-character substrings and each
+    trigram maps to a sorted ``array('i')`` of row positions. A query term's
+    postings are intersected smallest first and the surviving candidates are
+    confirmed with a plain substring test, so results are exactly those of
+    ``name ILIKE '%term%'``. Terms shorter than three characters have no
+    trigram to look up and fall back to scanning the names.
+
+    A second set of postings over pg_trgm-style word trigrams backs
+    :meth:`fuzzy_search`.
+    """
+
+    def __init__(self, rows):
+        start = time.perf_counter()
+        ordered = sorted(rows)
+        self.appids = array('i', (appid for appid, _ in ordered))
+        self.names = [normalize(name or '') for _, name in ordered]
+
+        # Raw substring trigrams answer exact searches; word trigrams answer fuzzy ones
+        self.postings = {}
+        self.word_postings = {}
+        self.word_gram_counts = array('H')
+        for position, name in enumerate(self.names):
+            _add_postings(self.postings, trigrams(name), position)
+            grams = word_trigrams(name)
+            _add_postings(self.word_postings, grams, position)
+            self.word_gram_counts.append(min(len(grams), 0xFFFF))
+        self.build_seconds = time.perf_counter() - start
+
+        self.lookups = 0
+        self.lookup_seconds = 0.0
+
+    def __len__(self):
+        return len(self.appids)
+
+    def _positions(self, term):
+        grams = trigrams(term)
+        if not grams:
+            return [i for i, name in enumerate(self.names) if term in name]
+
+        lists = []
+        for gram in grams:
+            posting = self.postings.get(gram)
+            if posting is None:
+                return []
+            lists.append(posting)
+        lists.sort(key=len)
+
+        # Intersect smallest first; set.intersection_update walks each array in C
+        candidates = set(lists[0])
+        for posting in lists[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                return []
+        # Shared trigrams don't guarantee they are adjacent in the right order
+        return sorted(p for p in candidates if term in self.names[p])
+
+    def search(self, term):
+        """Appids, in ascending order, whose name contains ``term`` case-insensitively"""
+        start = time.perf_counter()
+        positions = self._positions(normalize(term))
+        result = [self.appids[p] for p in positions]
+        self.lookups += 1
+        self.lookup_seconds += time.perf_counter() - start
+        return result
+
+    def fuzzy_search(self, term, limit=20, min_score=0.5, max_candidates=5000):
+        """Typo-tolerant lookup: up to ``limit`` (appid, score) pairs, best first.
+
+        Matching uses word trigrams, which ignore punctuation and spacing.
+        ``score`` is the fraction of the term's trigrams found in the name,
+        ties broken by trigram Jaccard similarity so that tighter names win.
+        A name scoring at least ``min_score`` must contain one of the term's
+        ``len(grams) - needed + 1`` rarest trigrams, so only those postings
+        are scanned for candidates (prefix filtering). If they hold more than
+        ``max_candidates`` names, the ones sharing the most of those
+        trigrams with the term are kept, and only these are scored against
+        the other postings. Cost therefore tracks the rarest postings and
+        the candidate cap rather than the size of the catalogue.
+        """
+        start = time.perf_counter()
+        grams = word_trigrams(normalize(term))
+        if not grams:
+            return []
+        needed = max(1, math.ceil(min_score * len(grams)))
+        lists = sorted((self.word_postings.get(gram, ()) for gram in grams), key=len)
+        prefix = len(grams) - needed + 1
+
+        shared = Counter()
+        for posting in lists[:prefix]:
+            shared.update(posting)
+        if len(shared) > max_candidates:
+            # Ties go to the lower position, so the same term always keeps the same names
+            kept = heapq.nsmallest(max_candidates, shared.items(), key=lambda item: (-item[1], item[0]))
+            shared = Counter(dict(kept))
+        candidates = set(shared)
+        for posting in lists[prefix:]:
+            shared.update(_hits(candidates, posting))
+        scored = []
+        for position, count in shared.items():
+            if count >= needed:
+                jaccard = count / (len(grams) + self.word_gram_counts[position] - count)
+                scored.append((count / len(grams), jaccard, -position))
+        best = heapq.nlargest(limit, scored)
+
+        self.lookups += 1
+        self.lookup_seconds += time.perf_counter() - start
+        return [(self.appids[-position], round(score, 3)) for score, _, position in best]
+
+    def stats(self):
+        return {
+            'names': len(self.appids),
+            'trigrams': len(self.postings),
+            'postings': sum(len(p) for p in self.postings.values()),
+            'word_trigrams': len(self.word_postings),
+            'word_postings': sum(len(p) for p in self.word_postings.values()),
+            'build_ms': round(self.build_seconds * 1000, 1),
+            'lookups': self.lookups,
+            'lookup_avg_us': round(self.lookup_seconds / self.lookups * 1e6, 1) if self.lookups else 0.0,
+        }
+
+
+class PrefixIndex:
+    """Sorted array of normalized names for ranked prefix (typeahead) lookups.
+
+    ``rows`` are (appid, name, rank) where a larger rank (any comparable
+    value) is more popular. A prefix selects a contiguous slice of the sorted
+    names with two binary searches; the top ``limit`` of that slice by rank
+    are returned. Slices for one- and two-character prefixes can hold
+    thousands of names, so their rankings are memoized.
+    """
+
+    MEMO_PREFIX_LENGTH = 2
+
+    def __init__(self, rows, max_limit=50):
+        start = time.perf_counter()
+        # Replace each rank by its position in popularity order (0 = most popular)
+        by_rank = sorted(rows, key=lambda row: row[2], reverse=True)
+        entries = sorted((normalize(name or ''), position, name or '', appid)
+                         for position, (appid, name, _) in enumerate(by_rank))
+        self.keys = [key for key, *_ in entries]
+        self.entries = [(position, name, appid) for _, position, name, appid in entries]
+        self.max_limit = max_limit
+        self._memo = {}
+        self.build_seconds = time.perf_counter() - start
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _ranked(self, prefix, limit):
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + '\U0010ffff', lo)
+        if hi - lo <= limit:
+            return sorted(self.entries[lo:hi])
+        return heapq.nsmallest(limit, self.entries[lo:hi])
+
+    def complete(self, prefix, limit=10):
+        """Up to ``limit`` (appid, name) pairs whose name starts with ``prefix``, most popular first"""
+        prefix = normalize(prefix)
+        limit = max(1, min(limit, self.max_limit))
+        if not prefix:
+            return []
+        if len(prefix) <= self.MEMO_PREFIX_LENGTH:
+            ranked = self._memo.get(prefix)
+            if ranked is None:
+                ranked = self._memo[prefix] = self._ranked(prefix, self.max_limit)
+        else:
+            ranked = self._ranked(prefix, limit)
+        return [(appid, name) for _, name, appid in ranked[:limit]]
+
+    def stats(self):
+        return {
+            'names': len(self.keys),
+            'memoized_prefixes': len(self._memo),
+            'build_ms': round(self.build_seconds * 1000, 1),
+        }
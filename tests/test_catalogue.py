@@ -0,0 +1,137 @@
+"""Checks of catalogue.Catalogue paging against plain sorts of its rows."""
+import base64
+import datetime
+import json
+import unittest
+from decimal import Decimal
+
+from catalogue import Catalogue
+
+
+def row(appid, name, released, price, score, owners=(0, 20000)):
+    return (appid, name, released, price, score, *owners, 'windows', 'Action', 'Single-player', 0)
+
+
+ROWS = [
+    row(10, 'Counter-Strike', datetime.date(2000, 11, 1), Decimal('7.19'), Decimal('97.39')),
+    row(20, 'Team Fortress Classic', datetime.date(1999, 4, 1), Decimal('3.99'), Decimal('83.98')),
+    row(30, 'Day of Defeat', datetime.date(2003, 5, 1), Decimal('3.99'), Decimal('85.16')),
+    row(40, 'Deathmatch Classic', None, None, None),
+    row(50, 'Half-Life: Opposing Force', datetime.date(1999, 11, 1), Decimal('3.99'), Decimal('94.93')),
+    row(60, 'Ricochet', datetime.date(2000, 11, 1), None, Decimal('80.29')),
+    row(70, 'Half-Life', datetime.date(1998, 11, 8), Decimal('7.19'), None),
+]
+
+
+def cursor(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+class CataloguePageTest(unittest.TestCase):
+    def setUp(self):
+        self.catalogue = Catalogue(ROWS)
+
+    def walk_forward(self, sort, page_size):
+        appids, after = [], None
+        while True:
+            page = self.catalogue.page(sort, after=after, page_size=page_size)
+            appids += [r[-1] for r in page]
+            if page.next_cursor is None:
+                return appids, page
+            after = page.next_cursor
+
+    def test_pages_forward_in_listing_order(self):
+        # Ascending sorts put NULLs last, descending ones first, as Postgres does;
+        # ties go by appid in the sort's direction
+        expected = {
+            'appid': [10, 20, 30, 40, 50, 60, 70],
+            'price': [20, 30, 50, 10, 70, 40, 60],
+            'newest': [40, 30, 60, 10, 50, 20, 70],
+            'rating': [10, 50, 30, 20, 60, 70, 40],
+            'name': [10, 30, 40, 70, 50, 60, 20],
+        }
+        for sort, appids in expected.items():
+            for page_size in (1, 2, 3, 7, 50):
+                with self.subTest(sort=sort, page_size=page_size):
+                    self.assertEqual(self.walk_forward(sort, page_size)[0], appids)
+
+    def test_pages_backward_to_the_start(self):
+        for sort in ('price', 'newest', 'rating'):
+            with self.subTest(sort=sort):
+                forward, last = self.walk_forward(sort, 2)
+                appids, page = [r[-1] for r in last], last
+                while page.prev_cursor is not None:
+                    page = self.catalogue.page(sort, before=page.prev_cursor, page_size=2)
+                    appids = [r[-1] for r in page] + appids
+                self.assertEqual(appids, forward)
+                self.assertIsNotNone(page.next_cursor)
+
+    def test_first_and_last_pages_have_one_cursor(self):
+        first = self.catalogue.page('appid', page_size=3)
+        self.assertIsNone(first.prev_cursor)
+        self.assertIsNotNone(first.next_cursor)
+        last = self.catalogue.page('appid', after=cursor(['appid', 50, 50]), page_size=3)
+        self.assertEqual([r[-1] for r in last], [60, 70])
+        self.assertIsNone(last.next_cursor)
+        self.assertIsNotNone(last.prev_cursor)
+
+    def test_malformed_cursors_raise_value_error(self):
+        bad = [
+            ('price', 'WyJwcmljZSIsWzFdLDVd'),          # ["price",[1],5]
+            ('newest', cursor(['newest', 5, 5])),
+            ('newest', cursor(['newest', 'yesterday', 5])),
+            ('price', cursor(['price', {'a': 1}, 5])),
+            ('price', cursor(['price', True, 5])),
+            ('price', cursor(['price', 'cheap', 5])),
+            ('price', cursor(['price', 1, '5'])),
+            ('price', cursor(['newest', 1, 5])),
+            ('price', 'not a cursor'),
+        ]
+        for sort, value in bad:
+            for direction in ('after', 'before'):
+                with self.subTest(cursor=value, direction=direction):
+                    with self.assertRaises(ValueError):
+                        self.catalogue.page(sort, **{direction: value})
+
+    def test_page_filtered_to_rows(self):
+        rows_in = self.catalogue.bitmap_of([20, 50, 70, 999])
+        page = self.catalogue.page('price', page_size=2, rows_in=rows_in)
+        self.assertEqual([r[-1] for r in page], [20, 50])
+        page = self.catalogue.page('price', after=page.next_cursor, page_size=2, rows_in=rows_in)
+        self.assertEqual([r[-1] for r in page], [70])
+
+
+class SetReviewScoreTest(unittest.TestCase):
+    def setUp(self):
+        self.catalogue = Catalogue(ROWS)
+
+    def rating_order(self):
+        return [r[-1] for r in self.catalogue.page('rating', page_size=50)]
+
+    def test_game_moves_within_rating_order(self):
+        self.catalogue.set_review_score(60, Decimal('99.00'))
+        self.assertEqual(self.rating_order(), [60, 10, 50, 30, 20, 70, 40])
+        top = self.catalogue.page('rating', page_size=1).rows[0]
+        self.assertEqual(top[3], Decimal('99.00'))
+
+    def test_game_can_become_unrated_and_rated(self):
+        self.catalogue.set_review_score(10, None)
+        self.assertEqual(self.rating_order(), [50, 30, 20, 60, 70, 40, 10])
+        self.catalogue.set_review_score(70, Decimal('90'))
+        self.assertEqual(self.rating_order(), [50, 70, 30, 20, 60, 40, 10])
+        self.assertEqual(self.catalogue.stats()['repairs'], 2)
+
+    def test_matches_a_fresh_snapshot(self):
+        self.catalogue.set_review_score(30, Decimal('50.5'))
+        fresh = Catalogue(self.catalogue.rows)
+        self.assertEqual(self.catalogue.keys['rating'], fresh.keys['rating'])
+        self.assertEqual(list(self.catalogue.order['rating']), list(fresh.order['rating']))
+
+    def test_unknown_game_is_ignored(self):
+        self.catalogue.set_review_score(999, Decimal('50'))
+        self.assertEqual(self.rating_order(), [10, 50, 30, 20, 60, 70, 40])
+        self.assertEqual(self.catalogue.stats()['repairs'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+"""Checks of db.StatementCache against pg8000's own prepared statement class.
+
+A fake connection answers the PARSE/DESCRIBE round trip, so no database is
+needed; what is exercised is the pg8000.legacy.PreparedStatement that
+pg8000.connect() connections hand out.
+"""
+import unittest
+
+import pg8000.legacy
+
+from db import StatementCache
+
+
+class FakeConnection:
+    """Just enough of pg8000.legacy.Connection for prepare() to build a real PreparedStatement"""
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.prepared = []
+
+    def prepare(self, operation):
+        return pg8000.legacy.PreparedStatement(self, operation)
+
+    def prepare_statement(self, statement, oids):
+        self.prepared.append(statement)
+        return b"statement\0", [{'name': name} for name in self.columns], ()
+
+
+class StatementCacheTest(unittest.TestCase):
+    def test_columns_of_a_prepared_statement(self):
+        cache = StatementCache({'game_detail': "SELECT steam.*, support.website FROM steam WHERE appid = :appid"})
+        conn = FakeConnection(['appid', 'name', 'website'])
+        self.assertEqual(cache.columns(conn, 'game_detail'), ['appid', 'name', 'website'])
+
+    def test_statements_are_prepared_once_per_connection(self):
+        cache = StatementCache({'a': "SELECT 1", 'b': "SELECT 2"})
+        conn = FakeConnection(['x'])
+        cache.columns(conn, 'a')
+        cache.columns(conn, 'a')
+        self.assertEqual(len(conn.prepared), 1)
+        self.assertEqual(cache.stats()['prepares'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
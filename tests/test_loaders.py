@@ -0,0 +1,95 @@
+"""Checks of loaders.parse_support() and CopyFeed on a synthetic support file 100x the shipped one.
+
+The rows are generated as they are read, so neither the test nor the code
+under test ever holds the file; no database is needed.
+"""
+import csv
+import io
+import pathlib
+import tracemalloc
+import unittest
+
+from loaders import COPY_CHUNK_BYTES, SUPPORT_FIELDS, CopyFeed, Rejects, parse_support
+
+SUPPORT_CSV = pathlib.Path(__file__).parent.parent / "steam_support_info.csv"
+
+# One row in REJECT_EVERY is unusable, in turn for each of these reasons
+BAD_ROWS = (
+    lambda i: f"x{i},http://example.com/,,\n",               # appid is not an integer
+    lambda i: f"{i},http://example.com/\n",                  # too few fields
+    lambda i: f"{i},http://example.com/\0,,\n",              # NUL character
+    lambda i: f"{i},,,,\n",                                  # too many fields
+)
+REJECT_EVERY = 997
+
+
+def support_lines(rows):
+    """Lines of a steam_support_info.csv with ``rows`` data rows"""
+    yield ",".join(SUPPORT_FIELDS) + "\n"
+    for i in range(rows):
+        if i % REJECT_EVERY == REJECT_EVERY - 1:
+            yield BAD_ROWS[i // REJECT_EVERY % len(BAD_ROWS)](i)
+        else:
+            # Quoted fields with commas, and an empty one that becomes NULL
+            yield f'{i},"http://example.com/{i}, the site",http://example.com/{i}/support,\n'
+
+
+def rejected(rows):
+    return rows // REJECT_EVERY
+
+
+def stream(rows):
+    """(rows, rejects, bytes, largest chunk) of feeding ``rows`` synthetic rows through COPY"""
+    rejects = Rejects(None)
+    feed = CopyFeed(parse_support(support_lines(rows), rejects))
+    size = largest = 0
+    for chunk in feed:
+        size += len(chunk)
+        largest = max(largest, len(chunk))
+    if feed.error is not None:
+        raise feed.error
+    return feed.count, rejects.count, size, largest
+
+
+def peak_allocation(rows):
+    tracemalloc.start()
+    try:
+        stream(rows)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class SupportStreamTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open(SUPPORT_CSV, encoding='utf-8') as source:
+            cls.shipped_rows = sum(1 for _ in source) - 1
+
+    def test_parsed_rows_become_copy_csv(self):
+        rejects = Rejects(None)
+        text = ''.join(CopyFeed(parse_support(support_lines(REJECT_EVERY + 1), rejects)))
+        rows = list(csv.reader(io.StringIO(text)))
+        self.assertEqual(len(rows), REJECT_EVERY)
+        self.assertEqual(rows[0], ['2', '0', 'http://example.com/0, the site', 'http://example.com/0/support', ''])
+        self.assertEqual(rejects.count, 1)
+
+    def test_hundred_times_the_shipped_file(self):
+        rows = 100 * self.shipped_rows
+        count, rejects, size, largest = stream(rows)
+        self.assertEqual(count, rows - rejected(rows))
+        self.assertEqual(rejects, rejected(rows))
+        self.assertGreater(size, 100 * SUPPORT_CSV.stat().st_size)
+        # Chunks are cut as soon as they pass COPY_CHUNK_BYTES
+        self.assertLess(largest, COPY_CHUNK_BYTES + 1024)
+
+    def test_memory_does_not_grow_with_file_size(self):
+        small = peak_allocation(self.shipped_rows)
+        large = peak_allocation(10 * self.shipped_rows)
+        # Ten times the rows may not take more than a couple of COPY chunks more
+        self.assertLess(large, small + 4 * COPY_CHUNK_BYTES)
+        self.assertLess(large, 32 * COPY_CHUNK_BYTES)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+"""Checks of pagination.fetch_page()'s choice of keyset statements."""
+import unittest
+
+from pagination import encode_cursor, fetch_page
+from queries import NULLABLE_SORTS, SORTS, STATEMENTS
+
+
+class RecordingStatements:
+    """Stands in for db.StatementCache, recording what fetch_page() runs"""
+
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.calls = []
+
+    def run(self, conn, name, /, **params):
+        self.calls.append((name, params))
+        return self.rows
+
+
+class FetchPageTest(unittest.TestCase):
+    def test_null_positions_use_their_own_statements(self):
+        cursor = encode_cursor('price', ('Ricochet', None, None, None, None, 60))
+        for direction in ('after', 'before'):
+            with self.subTest(direction=direction):
+                statements = RecordingStatements()
+                fetch_page(statements, None, 'price', page_size=10, **{direction: cursor})
+                self.assertEqual(statements.calls, [(f'page_price_{direction}_null', {'limit': 11, 'appid': 60})])
+
+    def test_positions_with_a_value_bind_it(self):
+        cursor = encode_cursor('price', ('Half-Life', None, 7.19, None, 7.19, 70))
+        statements = RecordingStatements()
+        fetch_page(statements, None, 'price', after=cursor, pattern='%half%')
+        (name, params), = statements.calls
+        self.assertEqual(name, 'search_page_price_after')
+        self.assertEqual((params['sort_value'], params['appid']), (7.19, 70))
+
+    def test_every_nullable_sort_has_null_statements(self):
+        for sort in SORTS:
+            for prefix in ('page', 'search_page'):
+                with self.subTest(sort=sort, prefix=prefix):
+                    has_null = f'{prefix}_{sort}_after_null' in STATEMENTS
+                    self.assertEqual(has_null, sort in NULLABLE_SORTS)
+                    self.assertEqual(f'{prefix}_{sort}_before_null' in STATEMENTS, has_null)
+                    self.assertNotIn(':sort_value', STATEMENTS.get(f'{prefix}_{sort}_after_null', ''))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""Checks of the in-memory name indexes against plain scans of the names."""
+import unittest
+
+from search_index import NameIndex, PrefixIndex
+
+NAMES = [
+    (10, 'Counter-Strike'),
+    (20, 'Counter-Strike: Source'),
+    (70, 'Half-Life'),
+    (220, 'Half-Life 2'),
+    (400, 'Portal'),
+    (620, 'Portal 2'),
+    (440, 'Team Fortress 2'),
+    (500, 'Left 4 Dead'),
+    (1, 'Zzz'),
+    (2, 'Zzzz Game'),
+    (3, 'AAA Racing'),
+    (4, None),
+]
+
+
+def ilike(term):
+    """Appids a database would return for name ILIKE '%term%'"""
+    return sorted(appid for appid, name in NAMES if name is not None and term.lower() in name.lower())
+
+
+class NameIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = NameIndex(NAMES)
+
+    def test_search_matches_ilike(self):
+        for term in ['portal', 'PORTAL 2', 'half-life', 'e 2', 'strike: s', 'ounter', 'zz', 'a', 'nothing']:
+            with self.subTest(term=term):
+                self.assertEqual(self.index.search(term), ilike(term))
+
+    def test_term_with_one_distinct_trigram_is_verified(self):
+        self.assertEqual(self.index.search('zzzz'), [2])
+        self.assertEqual(self.index.search('zzz'), [1, 2])
+        self.assertEqual(self.index.search('aaaaaa'), [])
+        self.assertEqual(self.index.search('aaa'), [3])
+
+    def test_shared_trigrams_out_of_order_are_not_a_match(self):
+        # 'Half-Life 2' holds both 'lif' and 'ife' but not 'life 3'
+        self.assertEqual(self.index.search('life 3'), [])
+
+    def test_fuzzy_search_tolerates_typos(self):
+        self.assertEqual([appid for appid, _ in self.index.fuzzy_search('portl')], [400, 620])
+        self.assertEqual(self.index.fuzzy_search('counter strik')[0][0], 10)
+        self.assertEqual(self.index.fuzzy_search('xyzzy'), [])
+        self.assertEqual(self.index.fuzzy_search(''), [])
+
+    def test_fuzzy_search_prefers_tighter_names(self):
+        best, runner_up = self.index.fuzzy_search('half life', limit=2)
+        self.assertEqual((best[0], runner_up[0]), (70, 220))
+        self.assertEqual(best[1], 1.0)
+
+    def test_fuzzy_search_respects_limit_and_min_score(self):
+        self.assertEqual(len(self.index.fuzzy_search('portal', limit=1)), 1)
+        self.assertTrue(all(score >= 0.9 for _, score in self.index.fuzzy_search('portal 2', min_score=0.9)))
+
+    def test_fuzzy_candidate_cap_keeps_the_best_names(self):
+        self.assertEqual(self.index.fuzzy_search('counter strike source', max_candidates=1),
+                         self.index.fuzzy_search('counter strike source', limit=1))
+
+
+class PrefixIndexTest(unittest.TestCase):
+    def setUp(self):
+        rows = [(appid, name, len(name or '')) for appid, name in NAMES]
+        self.index = PrefixIndex(rows, max_limit=3)
+
+    def test_complete_ranks_by_popularity(self):
+        self.assertEqual(self.index.complete('half'), [(220, 'Half-Life 2'), (70, 'Half-Life')])
+
+    def test_complete_is_case_insensitive_and_keeps_original_names(self):
+        self.assertEqual(self.index.complete('PORTAL '), [(620, 'Portal 2')])
+
+    def test_short_prefixes_are_memoized(self):
+        first = self.index.complete('p')
+        self.assertEqual(first, [(620, 'Portal 2'), (400, 'Portal')])
+        self.assertEqual(self.index.complete('p'), first)
+        self.assertEqual(self.index.stats()['memoized_prefixes'], 1)
+
+    def test_limit_is_clamped_to_max_limit(self):
+        self.assertEqual(len(self.index.complete('c', limit=1)), 1)
+        self.assertEqual(self.index.complete('', limit=5), [])
+        self.assertEqual(len(PrefixIndex([(i, f'game {i}', i) for i in range(10)], max_limit=3).complete('game', 50)), 3)
+
+    def test_no_match(self):
+        self.assertEqual(self.index.complete('quake'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()